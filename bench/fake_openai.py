@@ -0,0 +1,144 @@
+"""Stand-in for the OpenAI-compatible server the apps talk to, with fixed, configurable latency.
+
+Serves /v1/embeddings and /v1/chat/completions (including streaming). Embeddings are derived
+from a hash of the text and answers echo the question, so runs are reproducible and need no
+network. Questions sent with the ReAct prompt get one tool call and then a final answer, so
+the v6 agent can be benchmarked too.
+
+    python fake_openai.py --port 1234 --chat-latency 0.5 --token-latency 0.01
+"""
+import argparse
+import hashlib
+import json
+import re
+import struct
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def embedding(text, dim):
+    """Deterministic unit vector for text."""
+    values = []
+    counter = 0
+    while len(values) < dim:
+        digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        values.extend(v / 2 ** 31 - 1.0 for v in struct.unpack("8I", digest))
+        counter += 1
+    values = values[:dim]
+    norm = sum(v * v for v in values) ** 0.5 or 1.0
+    return [v / norm for v in values]
+
+
+def react_reply(prompt):
+    # first step: call the first tool, once an observation is in the scratchpad: answer
+    scratchpad = prompt.split("Begin!")[-1]
+    if "Observation:" in scratchpad:
+        return "Thought: I now know the final answer\nFinal Answer: This is a benchmark answer."
+    tool = re.search(r"one of \[([^,\]]+)", prompt)
+    tool = tool.group(1).strip() if tool else "search"
+    return f"Thought: I should look this up\nAction: {tool}\nAction Input: benchmark question"
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    options = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path.endswith("/embeddings"):
+            self.embeddings(body)
+        elif self.path.endswith("/chat/completions"):
+            self.chat(body)
+        else:
+            self.send_json({"error": {"message": f"unknown path {self.path}"}}, status=404)
+
+    def embeddings(self, body):
+        time.sleep(self.options.embed_latency)
+        texts = body["input"]
+        # a single string or a single list of token ids
+        if isinstance(texts, str) or (texts and isinstance(texts[0], int)):
+            texts = [texts]
+        data = [
+            {"object": "embedding", "index": i, "embedding": embedding(str(text), self.options.dim)}
+            for i, text in enumerate(texts)
+        ]
+        self.send_json({
+            "object": "list",
+            "model": body.get("model"),
+            "data": data,
+            "usage": {"prompt_tokens": len(texts), "total_tokens": len(texts)}
+        })
+
+    def chat(self, body):
+        prompt = body["messages"][-1]["content"]
+        if "Begin!" in prompt and "Final Answer" in prompt:
+            text = react_reply(prompt)
+        else:
+            words = f"Answer to: {prompt}".split()
+            text = " ".join((words * self.options.completion_tokens)[:self.options.completion_tokens])
+        tokens = [word + " " for word in text.split(" ")]
+        prompt_tokens = len(json.dumps(body["messages"])) // 4
+
+        time.sleep(self.options.chat_latency)
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in tokens:
+                time.sleep(self.options.token_latency)
+                chunk = {
+                    "id": "bench", "object": "chat.completion.chunk", "created": 0, "model": body.get("model"),
+                    "choices": [{"index": 0, "delta": {"role": "assistant", "content": token}, "finish_reason": None}]
+                }
+                self.send_chunk(f"data: {json.dumps(chunk)}\n\n")
+            self.send_chunk("data: [DONE]\n\n")
+            self.send_chunk("")
+            return
+
+        time.sleep(self.options.token_latency * len(tokens))
+        self.send_json({
+            "id": "bench", "object": "chat.completion", "created": 0, "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(tokens),
+                "total_tokens": prompt_tokens + len(tokens)
+            }
+        })
+
+    def send_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def send_json(self, payload, status=200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--chat-latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds per generated token")
+    parser.add_argument("--embed-latency", type=float, default=0.01, help="seconds per embeddings request")
+    parser.add_argument("--completion-tokens", type=int, default=20, help="length of non-agent answers")
+    parser.add_argument("--dim", type=int, default=64, help="embedding dimension")
+    Handler.options = parser.parse_args()
+
+    server = ThreadingHTTPServer((Handler.options.host, Handler.options.port), Handler)
+    print(f"fake OpenAI server on http://{Handler.options.host}:{Handler.options.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""Load generator for the /askquestion endpoint of any version of the app.
+
+Closed loop (--concurrency N clients that each send the next question when the previous one
+is answered) or open loop (--rate R requests per second with Poisson arrivals). Reports
+p50/p95/p99 latency, throughput and errors, and the app's memory (RSS) over time when
+--pid is given.
+
+    python loadgen.py --url http://localhost:5000/askquestion --concurrency 8 --duration 60
+    python loadgen.py --url http://localhost:8080/askquestion --rate 20 --duration 60 --pid 1234
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+QUESTIONS = [
+    "Which customers are associated with the company Cherry and Sons?",
+    "Tell me about the customers in Jersey",
+    "Which customers subscribed in 2022?",
+    "Who is the customer with the email garrettdurham@olsen.com?",
+    "What is the capital of France?",
+    "Tell me about Apple Inc.",
+    "Which companies have a website ending in .info?",
+    "List customers from Saint Barthelemy"
+]
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+
+def rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        return None
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.questions = QUESTIONS
+        if args.questions:
+            with open(args.questions, encoding="utf-8") as f:
+                self.questions = [line.strip() for line in f if line.strip()]
+        self.random = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = {}
+        self.memory = []
+        self.sent = 0
+        self.local = threading.local()
+        self.stop = threading.Event()
+
+    def next_request(self):
+        with self.lock:
+            i = self.sent
+            self.sent += 1
+            question = self.random.choice(self.questions)
+        return {"question": question, "session_id": f"bench-{i % self.args.sessions}", "stream": self.args.stream}
+
+    def send(self, payload, scheduled):
+        # one keep-alive session per client thread
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        try:
+            response = session.post(self.args.url, json=payload, timeout=self.args.timeout, stream=True)
+            for _ in response.iter_content(chunk_size=None):
+                pass
+            error = None if response.ok else f"HTTP {response.status_code}"
+        except requests.RequestException as e:
+            error = type(e).__name__
+        # measured from the scheduled start, so a backed-up app is not hidden by a slow client
+        latency = time.perf_counter() - scheduled
+        with self.lock:
+            if error:
+                self.errors[error] = self.errors.get(error, 0) + 1
+            else:
+                self.latencies.append(latency)
+
+    def closed_loop(self, deadline):
+        def client():
+            while time.perf_counter() < deadline and not self.stop.is_set():
+                if self.args.requests and self.sent >= self.args.requests:
+                    return
+                self.send(self.next_request(), time.perf_counter())
+
+        threads = [threading.Thread(target=client) for _ in range(self.args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def open_loop(self, deadline):
+        with ThreadPoolExecutor(max_workers=self.args.max_in_flight) as pool:
+            scheduled = time.perf_counter()
+            while scheduled < deadline and not (self.args.requests and self.sent >= self.args.requests):
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.send, self.next_request(), scheduled)
+                scheduled += self.random.expovariate(self.args.rate)
+
+    def sample_memory(self, start):
+        while not self.stop.wait(self.args.sample_interval):
+            rss = rss_bytes(self.args.pid)
+            if rss is not None:
+                self.memory.append((round(time.perf_counter() - start, 1), rss))
+
+    def run(self):
+        for _ in range(self.args.warmup):
+            self.send(self.next_request(), time.perf_counter())
+        self.latencies.clear()
+        self.errors.clear()
+
+        start = time.perf_counter()
+        if self.args.pid:
+            threading.Thread(target=self.sample_memory, args=(start,), daemon=True).start()
+        deadline = start + self.args.duration
+        try:
+            if self.args.rate:
+                self.open_loop(deadline)
+            else:
+                self.closed_loop(deadline)
+        finally:
+            self.stop.set()
+        return self.report(time.perf_counter() - start)
+
+    def report(self, elapsed):
+        completed = len(self.latencies)
+        result = {
+            "url": self.args.url,
+            "mode": f"open loop, {self.args.rate}/s" if self.args.rate else f"closed loop, {self.args.concurrency} clients",
+            "stream": self.args.stream,
+            "duration_s": round(elapsed, 2),
+            "completed": completed,
+            "errors": self.errors,
+            "throughput_rps": round(completed / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {
+                name: round(value * 1000, 1) if value is not None else None
+                for name, value in (
+                    ("p50", percentile(self.latencies, 50)),
+                    ("p95", percentile(self.latencies, 95)),
+                    ("p99", percentile(self.latencies, 99)),
+                    ("max", max(self.latencies) if self.latencies else None)
+                )
+            }
+        }
+        if self.memory:
+            result["rss_mb"] = {
+                "start": round(self.memory[0][1] / 2 ** 20, 1),
+                "end": round(self.memory[-1][1] / 2 ** 20, 1),
+                "max": round(max(rss for _, rss in self.memory) / 2 ** 20, 1),
+                "samples": [(t, round(rss / 2 ** 20, 1)) for t, rss in self.memory]
+            }
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:5000/askquestion")
+    parser.add_argument("--concurrency", type=int, default=4, help="clients in closed-loop mode")
+    parser.add_argument("--rate", type=float, help="requests per second, switches to open-loop mode")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="open-loop cap on outstanding requests")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--requests", type=int, help="stop after this many requests")
+    parser.add_argument("--warmup", type=int, default=2, help="requests sent before measuring")
+    parser.add_argument("--sessions", type=int, default=16, help="distinct session ids to spread requests over")
+    parser.add_argument("--stream", action="store_true", help="ask for server-sent events")
+    parser.add_argument("--questions", help="file with one question per line")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--pid", type=int, help="app process to sample RSS from")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="seconds between RSS samples")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    result = LoadTest(args).run()
+    samples = result.get("rss_mb", {}).pop("samples", None)
+    print(json.dumps(result, indent=2))
+    if args.json:
+        if samples is not None:
+            result["rss_mb"]["samples"] = samples
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
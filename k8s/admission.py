@@ -0,0 +1,214 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from langchain_core.embeddings import Embeddings
+from opentelemetry import metrics
+
+# concurrent requests each process sends to a backend, 0 turns admission control off for it
+ADMISSION_LLM_CONCURRENCY = int(os.getenv("ADMISSION_LLM_CONCURRENCY", "8"))
+ADMISSION_EMBEDDING_CONCURRENCY = int(os.getenv("ADMISSION_EMBEDDING_CONCURRENCY", "16"))
+# requests allowed to wait for a slot, and for how long, before they are turned away
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+
+meter = metrics.get_meter(__name__)
+queue_depth = meter.create_up_down_counter(
+    "admission.queue_depth",
+    unit="{request}",
+    description="Requests waiting for a slot on each backend"
+)
+in_flight = meter.create_up_down_counter(
+    "admission.in_flight",
+    unit="{request}",
+    description="Requests holding a slot on each backend"
+)
+wait_time = meter.create_histogram(
+    "admission.wait_time",
+    unit="s",
+    description="Time requests waited for a slot on each backend"
+)
+rejected = meter.create_counter(
+    "admission.rejected",
+    description="Requests turned away from each backend, by reason (queue_full or timeout)"
+)
+
+
+class Overloaded(Exception):
+    """Raised instead of sending a request to a saturated backend."""
+
+    def __init__(self, backend, reason, retry_after):
+        super().__init__(f"{backend} is overloaded ({reason}), retry after {retry_after}s")
+        self.backend = backend
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("wake", "granted")
+
+    def __init__(self, wake):
+        self.wake = wake
+        self.granted = False
+
+
+class AdmissionController:
+    """At most `limit` concurrent requests to one backend, with a bounded FIFO queue in front.
+
+    A request that finds the queue full, or waits longer than queue_timeout, gets Overloaded
+    right away instead of adding to the pile, so a saturated backend keeps its throughput and
+    the requests it does take keep their latency. Sync (slot) and async (aslot) callers share
+    the same limit and queue."""
+
+    def __init__(
+        self,
+        name,
+        limit,
+        max_queue=ADMISSION_QUEUE_SIZE,
+        queue_timeout=ADMISSION_QUEUE_TIMEOUT
+    ):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._attributes = {"backend": name}
+        self._in_flight = 0
+        self._waiters = deque()
+        # moving average of how long a slot is held, for the Retry-After estimate
+        self._hold_time = 1.0
+        self._lock = threading.Lock()
+
+    def _overloaded(self, reason):
+        rejected.add(1, {**self._attributes, "reason": reason})
+        # time for the queue ahead to drain at the current pace
+        retry_after = math.ceil((len(self._waiters) + 1) * self._hold_time / self.limit)
+        return Overloaded(self.name, reason, max(retry_after, 1))
+
+    def _enqueue(self, wake):
+        """None when a slot was free and is now taken, otherwise the queued waiter."""
+        with self._lock:
+            if self._in_flight < self.limit and not self._waiters:
+                self._in_flight += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                raise self._overloaded("queue_full")
+            waiter = _Waiter(wake)
+            self._waiters.append(waiter)
+        queue_depth.add(1, self._attributes)
+        return waiter
+
+    def _abandon(self, waiter):
+        """Takes a waiter that gave up off the queue. True if it was granted a slot meanwhile."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+        queue_depth.add(-1, self._attributes)
+        return False
+
+    def _release(self, held=None):
+        with self._lock:
+            if held is not None:
+                self._hold_time += 0.2 * (held - self._hold_time)
+            waiter = None
+            if self._waiters:
+                # the slot is handed to the oldest waiter rather than freed
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+            else:
+                self._in_flight -= 1
+        if waiter is not None:
+            queue_depth.add(-1, self._attributes)
+            waiter.wake()
+
+    def check(self):
+        """Raises Overloaded if a request arriving now would find the queue full."""
+        if self.limit > 0 and len(self._waiters) >= self.max_queue:
+            raise self._overloaded("queue_full")
+
+    @contextmanager
+    def _held(self, start):
+        wait_time.record(time.perf_counter() - start, self._attributes)
+        in_flight.add(1, self._attributes)
+        acquired = time.perf_counter()
+        try:
+            yield
+        finally:
+            in_flight.add(-1, self._attributes)
+            self._release(time.perf_counter() - acquired)
+
+    @contextmanager
+    def slot(self):
+        if self.limit <= 0:
+            yield
+            return
+        start = time.perf_counter()
+        event = threading.Event()
+        waiter = self._enqueue(event.set)
+        if waiter is not None and not event.wait(self.queue_timeout) and not self._abandon(waiter):
+            raise self._overloaded("timeout")
+        with self._held(start):
+            yield
+
+    @asynccontextmanager
+    async def aslot(self):
+        if self.limit <= 0:
+            yield
+            return
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            # the slot may be released on another thread
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        waiter = self._enqueue(wake)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(granted, self.queue_timeout)
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    raise self._overloaded("timeout")
+            except asyncio.CancelledError:
+                # e.g. the client went away, give back a slot granted in the meantime
+                if self._abandon(waiter):
+                    self._release()
+                raise
+        with self._held(start):
+            yield
+
+
+class AdmittedEmbeddings(Embeddings):
+    """Embeddings wrapper that only calls the underlying model while holding a slot of the
+    given AdmissionController. Meant to sit under CachedEmbeddings, so cache hits need no slot."""
+
+    def __init__(self, underlying, admission):
+        self.underlying = underlying
+        self.admission = admission
+        # keeps CachedEmbeddings keys the same with and without admission control
+        self.model = getattr(underlying, "model", type(underlying).__name__)
+
+    def embed_documents(self, texts):
+        with self.admission.slot():
+            return self.underlying.embed_documents(texts)
+
+    async def aembed_documents(self, texts):
+        async with self.admission.aslot():
+            return await self.underlying.aembed_documents(texts)
+
+    def embed_query(self, text):
+        with self.admission.slot():
+            return self.underlying.embed_query(text)
+
+    async def aembed_query(self, text):
+        async with self.admission.aslot():
+            return await self.underlying.aembed_query(text)
+
+
+llm_admission = AdmissionController("llm", ADMISSION_LLM_CONCURRENCY)
+embedding_admission = AdmissionController("embeddings", ADMISSION_EMBEDDING_CONCURRENCY)
@@ -1,24 +1,47 @@
+# imported first so the startup report includes the time spent importing the libraries below
+from startup import startup
+
+import asyncio
+import itertools
+import json
 import os
+import time
 
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_core.chat_history import (
-    BaseChatMessageHistory,
-    InMemoryChatMessageHistory,
-)
-from langchain_core.runnables.history import RunnableWithMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_openai import OpenAIEmbeddings
-from langchain.vectorstores.chroma import Chroma
-from flask import Flask, request
+from flask import Flask, Response, request
+from opentelemetry import metrics
 from opentelemetry.instrumentation.langchain import LangchainInstrumentor
 
-from langchain_redis import RedisCache, RedisSemanticCache
+from langchain_redis import RedisCache
 from langchain.globals import set_llm_cache
 
 import openlit
 
+from embedding_cache import CachedEmbeddings
+from batching import EMBEDDING_BATCH_WINDOW_MS, MicroBatchingEmbeddings
+from semantic_cache import InMemorySemanticCache, RedisSemanticAnswerCache, fingerprint
+from history_store import create_history_store, history_input, with_trimmed_history
+from context import format_context
+from numpy_store import VECTOR_STORE, NumpyVectorStore
+from stages import StagedChatMessageHistory, stage
+from admission import AdmittedEmbeddings, Overloaded, embedding_admission, llm_admission
+from hybrid import RETRIEVAL_MODE, HybridIndex
+from router import LLM_BACKENDS, RoutedChatModel, backends_from_env
+
+startup.mark("imports")
+
 otel_endpoint = os.getenv("OTEL_EXPORTER_OTLP_HTTP_ENDPOINT", "http://127.0.0.1:4318")
-openlit.init(otlp_endpoint=otel_endpoint, application_name="my-llm-app", environment="test")
+
+# PREFORK=true (set by gunicorn.conf.py) leaves telemetry, the warm-up and the state that can't
+# be shared across a fork to init_worker(), which the pre-fork server calls in each worker
+PREFORK = os.getenv("PREFORK", "false").lower() == "true"
+
+def init_telemetry():
+    openlit.init(otlp_endpoint=otel_endpoint, application_name="my-llm-app", environment="test")
+    LangchainInstrumentor().instrument()
 
 # Use the environment variable if set, otherwise default to localhost
 REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379")
@@ -29,46 +52,308 @@ set_llm_cache(redis_cache)
 
 
 app = Flask(__name__)
-LangchainInstrumentor().instrument()
-model = ChatOpenAI(model="gpt-3.5-turbo")
+if not PREFORK:
+    init_telemetry()
+startup.mark("telemetry")
+# LLM_BACKENDS routes each request to the fastest healthy of several backends instead
+if LLM_BACKENDS:
+    model = RoutedChatModel(backends=backends_from_env())
+else:
+    model = ChatOpenAI(model="gpt-3.5-turbo")
 
-embeddings_model = OpenAIEmbeddings()
+# repeated questions are answered from the embedding cache instead of the embeddings endpoint
+# EMBEDDING_BATCH_WINDOW_MS > 0 sends concurrent cache misses as one batched request
+embeddings = OpenAIEmbeddings()
+embeddings = AdmittedEmbeddings(embeddings, embedding_admission)
+if EMBEDDING_BATCH_WINDOW_MS > 0:
+    embeddings = MicroBatchingEmbeddings(embeddings)
+embeddings_model = CachedEmbeddings(embeddings)
+startup.mark("clients")
 
-db = Chroma(
-    persist_directory="../my_embeddings",
-    embedding_function=embeddings_model
+def open_vector_store():
+    # VECTOR_STORE=numpy answers searches from an in-memory index exported by customer_data.py
+    if VECTOR_STORE == "numpy":
+        return NumpyVectorStore.load(os.getenv("NUMPY_INDEX_PATH", "../my_embeddings_numpy"), embeddings_model)
+    # chromadb is only imported when it is used
+    from langchain.vectorstores.chroma import Chroma
+
+    return Chroma(
+        persist_directory="../my_embeddings",
+        embedding_function=embeddings_model
+    )
+
+# the memory-mapped numpy index is shared by pre-forked workers, while a Chroma client
+# can't cross a fork and is opened by each worker instead
+db = None if PREFORK and VECTOR_STORE != "numpy" else open_vector_store()
+
+# exact and keyword indexes over the CSV, fused with the vector search results
+hybrid_index = HybridIndex.from_csv("./customers-1000.csv") if RETRIEVAL_MODE == "hybrid" else None
+startup.mark("indexes")
+
+# answers are cached in-process by default, set SEMANTIC_CACHE_BACKEND=redis to share them between replicas
+if os.getenv("SEMANTIC_CACHE_BACKEND", "memory") == "redis":
+    answer_cache = RedisSemanticAnswerCache(REDIS_URL)
+else:
+    answer_cache = InMemorySemanticCache()
+
+meter = metrics.get_meter(__name__)
+time_to_first_token = meter.create_histogram(
+    "askquestion.time_to_first_token",
+    unit="s",
+    description="Time from receiving a streamed question to sending its first token"
 )
 
-store = {}
-config = {"configurable": {"session_id": "test"}}
+context_tokens = meter.create_histogram(
+    "askquestion.context_tokens",
+    unit="{token}",
+    description="Estimated tokens of retrieved context put into the prompt"
+)
 
-def get_session_history(session_id: str) -> BaseChatMessageHistory:
-    if session_id not in store:
-        store[session_id] = InMemoryChatMessageHistory()
-    return store[session_id]
+def sse(token):
+    return f"data: {json.dumps(token)}\n\n"
 
-with_message_history = RunnableWithMessageHistory(model, get_session_history)
+# bounded, evicting session histories (HISTORY_BACKEND=redis to share them across processes)
+store = create_history_store()
 
-@app.route("/askquestion", methods=['POST'])
-def ask_question():
+def get_session_history(session_id: str) -> BaseChatMessageHistory:
+    # loading and saving the history are timed as their own stages
+    return StagedChatMessageHistory(store.get(session_id))
 
-    data = request.json
-    question = data.get('question')
+# keep the prompt bounded as a conversation grows by dropping its oldest turns
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "2000"))
+with_message_history = with_trimmed_history(model, get_session_history, HISTORY_MAX_TOKENS)
+
+def retrieve(question):
+    # entity questions ("... the company Cherry and Sons?") are answered from the
+    # exact field indexes, without an embedding call
+    if hybrid_index is not None:
+        with stage("search", retrieval="exact") as current:
+            context = hybrid_index.exact_search(question)
+            current.set("documents", len(context))
+        if context:
+            return None, context
 
     # find the documents most similar to the question that we can pass as context
-    context = db.similarity_search(question)
+    with stage("embed"):
+        question_embedding = embeddings_model.embed_query(question)
+    with stage("search", retrieval=RETRIEVAL_MODE) as current:
+        context = db.similarity_search_by_vector(question_embedding)
+        if hybrid_index is not None:
+            context = hybrid_index.fuse(question, context)
+        current.set("documents", len(context))
+    return question_embedding, context
+
+async def aretrieve(question):
+    if hybrid_index is not None:
+        with stage("search", retrieval="exact") as current:
+            context = hybrid_index.exact_search(question)
+            current.set("documents", len(context))
+        if context:
+            return None, context
 
-    response = with_message_history.invoke(
-        [
+    with stage("embed"):
+        question_embedding = await embeddings_model.aembed_query(question)
+    with stage("search", retrieval=RETRIEVAL_MODE) as current:
+        context = await db.asimilarity_search_by_vector(question_embedding)
+        if hybrid_index is not None:
+            context = hybrid_index.fuse(question, context)
+        current.set("documents", len(context))
+    return question_embedding, context
+
+def build_messages(question, context):
+    with stage("prompt") as current:
+        # compact, deduplicated text instead of the repr of the retrieved Document list
+        context_text, tokens_used = format_context(context)
+        context_tokens.record(tokens_used)
+        current.set("documents", len(context))
+        current.set("context_tokens", tokens_used)
+        return [
             SystemMessage(
-                content=f'Use the following pieces of context to answer the question: {context}'
+                content=f'Use the following pieces of context to answer the question:\n{context_text}'
             ),
             HumanMessage(
                 content=question
             )
-        ],
-        config=config
-    )
+        ]
+
+# answers depend on the earlier turns as well, so only a session's first question is
+# answered from, and saved to, the answer cache
+def first_turn(session_id):
+    return not get_session_history(session_id).messages
+
+async def afirst_turn(session_id):
+    return not await get_session_history(session_id).aget_messages()
+
+def cached_answer(question, session_id, question_embedding, docs_fingerprint):
+    # a paraphrase of an earlier question with the same context is answered from the cache
+    answer = answer_cache.lookup(question_embedding, docs_fingerprint, question)
+    if answer is not None:
+        get_session_history(session_id).add_messages(
+            [HumanMessage(content=question), AIMessage(content=answer)]
+        )
+    return answer
+
+# cached_answer for the async paths: the cache and the history may be in Redis, so they are
+# used from a worker thread instead of blocking the event loop
+async def acached_answer(question, session_id, question_embedding, docs_fingerprint):
+    answer = await asyncio.to_thread(answer_cache.lookup, question_embedding, docs_fingerprint, question)
+    if answer is not None:
+        await get_session_history(session_id).aadd_messages(
+            [HumanMessage(content=question), AIMessage(content=answer)]
+        )
+    return answer
+
+def answer_question(question, session_id):
+    config = {"configurable": {"session_id": session_id}}
+
+    question_embedding, context = retrieve(question)
+
+    docs_fingerprint = fingerprint(context)
+    cacheable = first_turn(session_id)
+    answer = cached_answer(question, session_id, question_embedding, docs_fingerprint) if cacheable else None
+    if answer is not None:
+        return answer
 
+    messages = build_messages(question, context)
+    with llm_admission.slot(), stage("llm") as current:
+        response = with_message_history.invoke(history_input(messages), config=config)
+        current.set_usage(messages, response)
+
+    if cacheable:
+        answer_cache.update(question_embedding, docs_fingerprint, question, response.content)
+    return response.content
+
+# same pipeline as answer_question, used by the ASGI app in asgi.py
+async def aanswer_question(question, session_id):
+    config = {"configurable": {"session_id": session_id}}
+
+    question_embedding, context = await aretrieve(question)
+
+    docs_fingerprint = fingerprint(context)
+    cacheable = await afirst_turn(session_id)
+    answer = await acached_answer(question, session_id, question_embedding, docs_fingerprint) if cacheable else None
+    if answer is not None:
+        return answer
+
+    messages = build_messages(question, context)
+    async with llm_admission.aslot():
+        with stage("llm") as current:
+            response = await with_message_history.ainvoke(history_input(messages), config=config)
+            current.set_usage(messages, response)
+
+    if cacheable:
+        await asyncio.to_thread(answer_cache.update, question_embedding, docs_fingerprint, question, response.content)
     return response.content
 
+# streaming variant of answer_question, yields the answer as server-sent events
+def stream_answer(question, session_id):
+    config = {"configurable": {"session_id": session_id}}
+    start = time.perf_counter()
+
+    question_embedding, context = retrieve(question)
+
+    docs_fingerprint = fingerprint(context)
+    cacheable = first_turn(session_id)
+    answer = cached_answer(question, session_id, question_embedding, docs_fingerprint) if cacheable else None
+    if answer is not None:
+        time_to_first_token.record(time.perf_counter() - start, {"cached": True})
+        yield sse(answer)
+        return
+
+    messages = build_messages(question, context)
+    tokens = []
+    with llm_admission.slot(), stage("llm", stream=True) as current:
+        for chunk in with_message_history.stream(history_input(messages), config=config):
+            if not chunk.content:
+                continue
+            if not tokens:
+                time_to_first_token.record(time.perf_counter() - start, {"cached": False})
+            tokens.append(chunk.content)
+            yield sse(chunk.content)
+        current.set_usage(messages, "".join(tokens))
+
+    if cacheable:
+        answer_cache.update(question_embedding, docs_fingerprint, question, "".join(tokens))
+
+async def astream_answer(question, session_id):
+    config = {"configurable": {"session_id": session_id}}
+    start = time.perf_counter()
+
+    question_embedding, context = await aretrieve(question)
+
+    docs_fingerprint = fingerprint(context)
+    cacheable = await afirst_turn(session_id)
+    answer = await acached_answer(question, session_id, question_embedding, docs_fingerprint) if cacheable else None
+    if answer is not None:
+        time_to_first_token.record(time.perf_counter() - start, {"cached": True})
+        yield sse(answer)
+        return
+
+    messages = build_messages(question, context)
+    tokens = []
+    async with llm_admission.aslot():
+        with stage("llm", stream=True) as current:
+            async for chunk in with_message_history.astream(history_input(messages), config=config):
+                if not chunk.content:
+                    continue
+                if not tokens:
+                    time_to_first_token.record(time.perf_counter() - start, {"cached": False})
+                tokens.append(chunk.content)
+                yield sse(chunk.content)
+            current.set_usage(messages, "".join(tokens))
+
+    if cacheable:
+        await asyncio.to_thread(answer_cache.update, question_embedding, docs_fingerprint, question, "".join(tokens))
+
+startup.mark("setup")
+
+# the first model, embeddings and vector store requests are made here rather than in a user's request
+def warm_up():
+    startup.warm_up([
+        ("embeddings", lambda: embeddings_model.embed_query("warm-up")),
+        ("vector_store", lambda: db.similarity_search_by_vector(embeddings_model.embed_query("warm-up"), k=1)),
+        ("model", lambda: model.invoke("Reply with OK"))
+    ])
+
+def init_worker():
+    """Per-worker setup under the pre-fork server, called by gunicorn.conf.py after the fork."""
+    global db
+    init_telemetry()
+    if db is None:
+        db = open_vector_store()
+    # the clients' first connections are made here, in the worker, so none are shared
+    warm_up()
+
+if not PREFORK:
+    warm_up()
+
+# requests a saturated backend can't take are turned away quickly instead of queueing up
+@app.errorhandler(Overloaded)
+def overloaded(e):
+    return "overloaded, retry later", 503, {"Retry-After": str(e.retry_after)}
+
+# readiness probe, 503 until the warm-up is done
+@app.route("/ready", methods=['GET'])
+def ready():
+    if startup.ready.is_set():
+        return "ready"
+    return "warming up", 503
+
+@app.route("/askquestion", methods=['POST'])
+def ask_question():
+
+    data = request.json
+    question = data.get('question')
+    session_id = data.get('session_id', 'default')
+
+    # opt in to token streaming with {"stream": true}
+    if data.get('stream'):
+        events = stream_answer(question, session_id)
+        # the first event is produced before the response starts, so an Overloaded
+        # backend still turns into a 503 rather than a broken stream
+        first = next(events, None)
+        return Response(itertools.chain([first] if first else [], events), mimetype="text/event-stream")
+
+    answer = answer_question(question, session_id)
+    with stage("serialize"):
+        return app.make_response(answer)
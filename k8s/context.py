@@ -0,0 +1,56 @@
+import os
+
+from tokens import count_tokens
+
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+
+# overlaps shorter than this are treated as coincidence rather than chunk overlap
+MIN_OVERLAP = 20
+
+
+def compact(text):
+    # one line per document: "Customer Id: 1; Company: Acme; ..." instead of one line per field
+    return "; ".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def _overlap(previous, text):
+    """Length of the longest suffix of previous that is also a prefix of text."""
+    if len(text) < MIN_OVERLAP:
+        return 0
+    start = previous.find(text[:MIN_OVERLAP])
+    while start != -1:
+        if text.startswith(previous[start:]):
+            return len(previous) - start
+        start = previous.find(text[:MIN_OVERLAP], start + 1)
+    return 0
+
+
+def format_context(docs, max_tokens=CONTEXT_MAX_TOKENS):
+    """Format retrieved documents compactly for the prompt, dropping duplicate and
+    overlapping chunks and cutting off at max_tokens. Returns (text, tokens used)."""
+    chunks = []
+    for doc in docs:
+        text = compact(doc.page_content)
+        if not text or any(text in chunk for chunk in chunks):
+            continue
+        chunks = [chunk for chunk in chunks if chunk not in text]
+        for chunk in chunks:
+            overlap = _overlap(chunk, text)
+            if overlap:
+                text = text[overlap:].lstrip("; ")
+        if text:
+            chunks.append(text)
+
+    lines = []
+    used = 0
+    for chunk in chunks:
+        tokens = count_tokens(chunk) + 1
+        if used + tokens > max_tokens:
+            remaining = max_tokens - used - 1
+            if remaining > 0:
+                lines.append(chunk[:remaining * 4])
+                used += count_tokens(lines[-1]) + 1
+            break
+        lines.append(chunk)
+        used += tokens
+    return "\n".join(lines), used
@@ -0,0 +1,41 @@
+# Pre-fork serving profile for app.py:
+#   gunicorn -c gunicorn.conf.py app:app
+# The master imports the app once, so the memory-mapped vector index, the CSV indexes and the
+# rest of the read-only state are shared copy-on-write by the workers. Each worker then sets up
+# its own telemetry and connections, which can't be shared across a fork.
+import gc
+import multiprocessing
+import os
+
+# tells app.py to leave telemetry and the warm-up to init_worker()
+os.environ["PREFORK"] = "true"
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8080")
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+# threads let a worker wait on several model requests at once
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+preload_app = True
+# streamed answers can take a while
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+
+def when_ready(server):
+    # the objects loaded by the master are left out of garbage collection, so collections in
+    # the workers don't write to their pages and un-share them
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from opentelemetry.instrumentation.auto_instrumentation import initialize
+    from opentelemetry.instrumentation.flask import FlaskInstrumentor
+
+    # what splunk-py-trace does on startup, once per worker: providers, exporters and their
+    # background threads, and the library instrumentations
+    initialize()
+
+    import app
+
+    # the Flask app was created in the master, before instrumentation
+    FlaskInstrumentor().instrument_app(app.app)
+    app.init_worker()
@@ -0,0 +1,173 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# Rows are keyed on this column so re-running an ingestion upserts instead of duplicating
+ID_COLUMN = "Customer Id"
+
+BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", "4"))
+
+
+def _field(value):
+    # short rows leave the missing fields as None, long rows put the extra values in a list
+    if isinstance(value, list):
+        return ",".join((v or "").strip() for v in value)
+    return (value or "").strip()
+
+
+def row_document(row, i, file_path):
+    """Document for one CSV row, formatted the same way as CSVLoader."""
+    content = "\n".join(f"{(k or '').strip()}: {_field(v)}" for k, v in row.items())
+    return Document(page_content=content, metadata={"source": file_path, "row": i})
+
+
+def iter_rows(file_path, id_column=ID_COLUMN):
+    """Lazily yield (id, Document) pairs for the rows of a CSV file."""
+    with open(file_path, newline="", encoding="utf-8") as csvfile:
+        for i, row in enumerate(csv.DictReader(csvfile)):
+            yield row[id_column], row_document(row, i, file_path)
+
+
+def iter_batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _embed(embeddings_model, batch):
+    vectors = embeddings_model.embed_documents([doc.page_content for _, doc in batch])
+    return batch, vectors
+
+
+def _upsert(db, futures, on_upsert=None):
+    count = 0
+    for future in futures:
+        batch, vectors = future.result()
+        ids = [row_id for row_id, _ in batch]
+        metadatas = [doc.metadata for _, doc in batch]
+        # the LangChain Chroma API (add_texts, add_documents) always embeds the texts itself and
+        # takes no precomputed vectors, so the batches embedded concurrently above are written
+        # with the upsert of the chromadb collection underneath it
+        db._collection.upsert(
+            ids=ids,
+            embeddings=vectors,
+            documents=[doc.page_content for _, doc in batch],
+            metadatas=metadatas
+        )
+        if on_upsert is not None:
+            on_upsert(ids, metadatas)
+        count += len(batch)
+    return count
+
+
+def ingest(db, embeddings_model, rows, batch_size=BATCH_SIZE, max_workers=MAX_WORKERS, on_upsert=None):
+    """Embed rows in batches with at most max_workers embedding requests in flight,
+    upserting each batch into the Chroma collection as soon as it is ready.
+
+    on_upsert, if given, is called with the ids and metadatas of every upserted batch, e.g.
+    MetadataIndex.add to keep a metadata index up to date."""
+    start = time.perf_counter()
+    count = 0
+    pending = set()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for batch in iter_batches(rows, batch_size):
+            # don't read further ahead than the pool can work on
+            if len(pending) >= max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                count += _upsert(db, done, on_upsert)
+                elapsed = time.perf_counter() - start
+                logger.info("ingested %d rows (%.1f rows/s)", count, count / elapsed)
+            pending.add(pool.submit(_embed, embeddings_model, batch))
+
+        count += _upsert(db, wait(pending).done, on_upsert)
+
+    elapsed = time.perf_counter() - start
+    logger.info("ingested %d rows in %.1fs (%.1f rows/s)", count, elapsed, count / elapsed if elapsed else 0.0)
+    return count
+
+
+def row_hash(doc):
+    return hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest_path, manifest):
+    # write to a temporary file first so an interrupted run never leaves a truncated manifest
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def incremental_ingest(
+    db,
+    embeddings_model,
+    rows,
+    manifest_path,
+    batch_size=BATCH_SIZE,
+    max_workers=MAX_WORKERS,
+    on_upsert=None,
+    can_delete=None,
+    on_delete=None
+):
+    """Embed and upsert only the rows that were added or changed since the last run,
+    and delete the rows that were removed, using a manifest of id -> content hash.
+
+    can_delete, if given, is called with the id of each row missing from this run once all
+    rows have been read. Rows it returns False for are kept, along with their manifest
+    entry, e.g. the pages of a crawl that failed to fetch or didn't reach them.
+
+    on_delete, if given, is called with the ids of every deleted batch, e.g.
+    MetadataIndex.remove."""
+    manifest = load_manifest(manifest_path)
+    current = {}
+
+    def changed_rows():
+        for row_id, doc in rows:
+            digest = row_hash(doc)
+            current[row_id] = digest
+            if manifest.get(row_id) != digest:
+                yield row_id, doc
+
+    upserted = ingest(db, embeddings_model, changed_rows(), batch_size, max_workers, on_upsert)
+
+    removed = []
+    for row_id, digest in manifest.items():
+        if row_id in current:
+            continue
+        if can_delete is None or can_delete(row_id):
+            removed.append(row_id)
+        else:
+            current[row_id] = digest
+    for batch in iter_batches(removed, batch_size):
+        db.delete(ids=batch)
+        if on_delete is not None:
+            on_delete(batch)
+
+    save_manifest(manifest_path, current)
+    logger.info(
+        "incremental ingest: %d added or changed, %d removed, %d unchanged",
+        upserted, len(removed), len(current) - upserted
+    )
+    return upserted, len(removed)
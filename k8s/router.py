@@ -0,0 +1,253 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from opentelemetry import metrics
+from pydantic import PrivateAttr
+
+# comma-separated chat model backends, "model" or "model@base_url", e.g.
+# LLM_BACKENDS="llama-3.2-3b-instruct@http://localhost:1234/v1,llama-3.2-3b-instruct@http://gpu-2:1234/v1"
+LLM_BACKENDS = os.getenv("LLM_BACKENDS", "")
+# "true" sends a duplicate request to the next backend when the first is slower than its usual p95
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() == "true"
+LLM_ROUTER_WINDOW = int(os.getenv("LLM_ROUTER_WINDOW", "100"))
+
+# latency samples needed before a backend's p95 is used as the hedge delay
+MIN_HEDGE_SAMPLES = 10
+
+meter = metrics.get_meter(__name__)
+router_requests = meter.create_counter(
+    "llm_router.requests",
+    description="Requests sent to each chat model backend, by result (ok or error) and whether they were hedges"
+)
+router_latency = meter.create_histogram(
+    "llm_router.latency",
+    unit="s",
+    description="Latency of each chat model backend"
+)
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_ROUTER_MAX_WORKERS", "32")))
+
+
+class BackendStats:
+    """Rolling latency and error rate of one backend, with a cooldown after repeated failures."""
+
+    def __init__(self, window, failure_threshold, cooldown):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+
+    def record(self, latency, ok):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+            self.consecutive_failures = 0
+        else:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                self.unhealthy_until = time.monotonic() + self.cooldown
+
+    def healthy(self):
+        return time.monotonic() >= self.unhealthy_until
+
+    def quantile(self, q):
+        if not self.latencies:
+            return None
+        values = sorted(self.latencies)
+        return values[min(int(q * len(values)), len(values) - 1)]
+
+    def score(self):
+        # untried backends score 0 so every backend gets measured, ones that have only failed
+        # score last; errors inflate the latency
+        if not self.latencies:
+            return float("inf") if self.outcomes else 0.0
+        error_rate = self.outcomes.count(False) / len(self.outcomes)
+        return self.quantile(0.5) / max(1.0 - error_rate, 0.05)
+
+
+class RoutedChatModel(BaseChatModel):
+    """Chat model that routes each request to the fastest healthy backend.
+
+    Failed requests fail over to the next backend. With hedge=True, a request that takes
+    longer than the backend's rolling p95 is also sent to the next backend, and whichever
+    answers first wins. Streams fail over until their first chunk and are not hedged."""
+
+    backends: list
+    hedge: bool = LLM_HEDGE
+    hedge_quantile: float = 0.95
+    window: int = LLM_ROUTER_WINDOW
+    failure_threshold: int = 3
+    cooldown: float = 30.0
+
+    _stats: list = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = [BackendStats(self.window, self.failure_threshold, self.cooldown) for _ in self.backends]
+
+    @property
+    def _llm_type(self):
+        return "routed-chat-model"
+
+    def _name(self, i):
+        backend = self.backends[i]
+        name = getattr(backend, "model_name", None) or getattr(backend, "model", None) or type(backend).__name__
+        return f"{i}:{name}"
+
+    def _ranked(self):
+        """Backend indexes, healthy ones first, fastest first."""
+        with self._lock:
+            return sorted(
+                range(len(self.backends)),
+                key=lambda i: (not self._stats[i].healthy(), self._stats[i].score())
+            )
+
+    def _hedge_delay(self, i):
+        with self._lock:
+            stats = self._stats[i]
+            if not self.hedge or len(stats.latencies) < MIN_HEDGE_SAMPLES:
+                return None
+            return stats.quantile(self.hedge_quantile)
+
+    def _record(self, i, latency, ok, hedged):
+        with self._lock:
+            self._stats[i].record(latency, ok)
+        attributes = {"backend": self._name(i), "result": "ok" if ok else "error", "hedged": hedged}
+        router_requests.add(1, attributes)
+        if ok:
+            router_latency.record(latency, {"backend": self._name(i)})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        ranked = self._ranked()
+        pending = {}
+
+        def launch(attempt):
+            i = ranked[attempt]
+            hedged = bool(pending)
+            start = time.perf_counter()
+            future = _executor.submit(self.backends[i].invoke, messages, stop=stop, **kwargs)
+            future.add_done_callback(
+                lambda f: self._record(i, time.perf_counter() - start, f.exception() is None, hedged)
+            )
+            pending[future] = i
+
+        launch(0)
+        attempt = 1
+        hedge_delay = self._hedge_delay(ranked[0])
+        error = None
+        while pending:
+            # only the first request is hedged, and only once
+            timeout = hedge_delay if attempt == 1 and attempt < len(ranked) else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                launch(attempt)
+                attempt += 1
+                continue
+            for future in done:
+                del pending[future]
+                if future.exception() is None:
+                    return ChatResult(generations=[ChatGeneration(message=future.result())])
+                error = future.exception()
+            # fail over once nothing else is in flight
+            if not pending and attempt < len(ranked):
+                launch(attempt)
+                attempt += 1
+        raise error
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        ranked = self._ranked()
+        pending = {}
+
+        def launch(attempt):
+            i = ranked[attempt]
+            hedged = bool(pending)
+            start = time.perf_counter()
+            task = asyncio.ensure_future(self.backends[i].ainvoke(messages, stop=stop, **kwargs))
+
+            def done(t):
+                if not t.cancelled():
+                    self._record(i, time.perf_counter() - start, t.exception() is None, hedged)
+
+            task.add_done_callback(done)
+            pending[task] = i
+
+        launch(0)
+        attempt = 1
+        hedge_delay = self._hedge_delay(ranked[0])
+        error = None
+        try:
+            while pending:
+                timeout = hedge_delay if attempt == 1 and attempt < len(ranked) else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch(attempt)
+                    attempt += 1
+                    continue
+                for task in done:
+                    del pending[task]
+                    if task.exception() is None:
+                        return ChatResult(generations=[ChatGeneration(message=task.result())])
+                    error = task.exception()
+                if not pending and attempt < len(ranked):
+                    launch(attempt)
+                    attempt += 1
+            raise error
+        finally:
+            # the losing request of a hedge is cancelled
+            for task in pending:
+                task.cancel()
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        ranked = self._ranked()
+        for attempt, i in enumerate(ranked):
+            start = time.perf_counter()
+            started = False
+            try:
+                for chunk in self.backends[i].stream(messages, stop=stop, **kwargs):
+                    started = True
+                    yield ChatGenerationChunk(message=chunk)
+            except Exception:
+                self._record(i, time.perf_counter() - start, False, False)
+                if started or attempt == len(ranked) - 1:
+                    raise
+                continue
+            self._record(i, time.perf_counter() - start, True, False)
+            return
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        ranked = self._ranked()
+        for attempt, i in enumerate(ranked):
+            start = time.perf_counter()
+            started = False
+            try:
+                async for chunk in self.backends[i].astream(messages, stop=stop, **kwargs):
+                    started = True
+                    yield ChatGenerationChunk(message=chunk)
+            except Exception:
+                self._record(i, time.perf_counter() - start, False, False)
+                if started or attempt == len(ranked) - 1:
+                    raise
+                continue
+            self._record(i, time.perf_counter() - start, True, False)
+            return
+
+
+def backends_from_env(backends=LLM_BACKENDS, **kwargs):
+    """ChatOpenAI models for LLM_BACKENDS. kwargs are passed to each, e.g. temperature."""
+    from langchain_openai import ChatOpenAI
+
+    models = []
+    for entry in filter(None, (entry.strip() for entry in backends.split(","))):
+        model, _, base_url = entry.partition("@")
+        # the router's own LLM cache lookup is enough
+        models.append(ChatOpenAI(model=model, base_url=base_url or None, cache=False, **kwargs))
+    return models
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "10000"))
+
+
+def doc_id(doc):
+    return getattr(doc, "id", None) or f"{doc.metadata.get('source')}:{doc.metadata.get('row')}"
+
+
+def fingerprint(docs):
+    """Fingerprint of the retrieved document IDs, so answers are only reused for the same context."""
+    return hashlib.sha1("\x00".join(doc_id(doc) for doc in docs).encode("utf-8")).hexdigest()
+
+
+def cosine_similarity(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def normalize_question(question):
+    return " ".join(question.lower().split())
+
+
+def _best_match(entries, vector, question, threshold, now):
+    best_answer, best_score = None, threshold
+    for entry in entries:
+        if entry["expires"] < now:
+            continue
+        # questions answered without an embedding can only match on their exact text
+        if vector is None or entry["vector"] is None:
+            if entry["question"] == question:
+                return entry["answer"]
+            continue
+        score = cosine_similarity(vector, entry["vector"])
+        if score >= best_score:
+            best_answer, best_score = entry["answer"], score
+    return best_answer
+
+
+class InMemorySemanticCache:
+    """Answers keyed on the question embedding and a fingerprint of the retrieved documents."""
+
+    def __init__(
+        self,
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        ttl=SEMANTIC_CACHE_TTL_SECONDS,
+        max_entries=SEMANTIC_CACHE_MAX_ENTRIES
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, vector, docs_fingerprint, question):
+        with self._lock:
+            entries = list(self._entries.get(docs_fingerprint, ()))
+        return _best_match(entries, vector, normalize_question(question), self.threshold, time.time())
+
+    def update(self, vector, docs_fingerprint, question, answer):
+        now = time.time()
+        entry = {
+            "vector": vector,
+            "question": normalize_question(question),
+            "answer": answer,
+            "expires": now + self.ttl
+        }
+        with self._lock:
+            if self._size >= self.max_entries:
+                self._evict(now)
+            self._entries.setdefault(docs_fingerprint, []).append(entry)
+            self._size += 1
+
+    def _evict(self, now):
+        # drop expired entries first, then the oldest fingerprints until there is room again
+        for key in list(self._entries):
+            self._entries[key] = [entry for entry in self._entries[key] if entry["expires"] >= now]
+            if not self._entries[key]:
+                del self._entries[key]
+        self._size = sum(len(entries) for entries in self._entries.values())
+        while self._size >= self.max_entries and self._entries:
+            oldest = next(iter(self._entries))
+            self._size -= len(self._entries.pop(oldest))
+
+
+class RedisSemanticAnswerCache:
+    """Same interface as InMemorySemanticCache, shared between replicas through Redis.
+
+    Each fingerprint's entries are a list of at most max_entries, oldest first."""
+
+    def __init__(
+        self,
+        redis_url,
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        ttl=SEMANTIC_CACHE_TTL_SECONDS,
+        max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+        prefix="semantic_answer_cache"
+    ):
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url)
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.prefix = prefix
+
+    def lookup(self, vector, docs_fingerprint, question):
+        entries = [json.loads(raw) for raw in self.client.lrange(f"{self.prefix}:{docs_fingerprint}", 0, -1)]
+        return _best_match(entries, vector, normalize_question(question), self.threshold, time.time())
+
+    def update(self, vector, docs_fingerprint, question, answer):
+        key = f"{self.prefix}:{docs_fingerprint}"
+        entry = {
+            "vector": list(vector) if vector is not None else None,
+            "question": normalize_question(question),
+            "answer": answer,
+            "expires": time.time() + self.ttl
+        }
+        pipe = self.client.pipeline()
+        # every entry has the same TTL, so the expired ones are at the head of the list
+        expired = self._count_expired(key, time.time())
+        if expired:
+            pipe.ltrim(key, expired, -1)
+        pipe.rpush(key, json.dumps(entry))
+        pipe.ltrim(key, -self.max_entries, -1)
+        pipe.expire(key, math.ceil(self.ttl))
+        pipe.execute()
+
+    def _count_expired(self, key, now):
+        count = 0
+        for raw in self.client.lrange(key, 0, -1):
+            if json.loads(raw)["expires"] >= now:
+                break
+            count += 1
+        return count
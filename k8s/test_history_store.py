@@ -0,0 +1,116 @@
+import time
+
+import fakeredis
+import pytest
+import redis
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+import history_store
+from history_store import InMemoryHistoryStore, RedisHistoryStore, history_input, with_trimmed_history
+
+
+@pytest.fixture
+def redis_urls(monkeypatch):
+    """Makes every Redis client a fakeredis one, on one shared fake server. Returns the URLs used."""
+    server = fakeredis.FakeServer()
+    urls = []
+
+    def from_url(url):
+        urls.append(url)
+        return fakeredis.FakeRedis(server=server)
+
+    monkeypatch.setattr(redis.Redis, "from_url", from_url)
+    return urls
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A time.monotonic the test moves forward by hand."""
+    now = [1000.0]
+    monkeypatch.setattr(history_store.time, "monotonic", lambda: now[0])
+    return now
+
+
+def turn(i):
+    return [HumanMessage(f"Question {i}"), AIMessage(f"Answer {i}")]
+
+
+def contents(history):
+    return [message.content for message in history.messages]
+
+
+def test_in_memory_history_keeps_the_last_messages():
+    history = InMemoryHistoryStore(max_messages=4).get("session")
+    for i in range(3):
+        history.add_messages(turn(i))
+    assert contents(history) == ["Question 1", "Answer 1", "Question 2", "Answer 2"]
+
+
+def test_in_memory_store_evicts_the_least_recently_used_session(clock):
+    store = InMemoryHistoryStore(max_sessions=2)
+    for session_id in ["a", "b"]:
+        store.get(session_id).add_messages(turn(0))
+    store.get("a")
+    store.get("c")
+    assert len(store) == 2
+    assert contents(store.get("a")) == ["Question 0", "Answer 0"]
+    # b was the least recently used, so it starts over
+    assert store.get("b").messages == []
+
+
+def test_in_memory_store_evicts_idle_sessions(clock):
+    store = InMemoryHistoryStore(ttl=60)
+    store.get("idle").add_messages(turn(0))
+    clock[0] += 30
+    store.get("active").add_messages(turn(0))
+    clock[0] += 31
+    store.get("active")
+    assert len(store) == 1
+    assert store.get("idle").messages == []
+
+
+def test_redis_history_keeps_the_last_messages(redis_urls):
+    store = RedisHistoryStore("redis://history", max_messages=4)
+    for i in range(3):
+        store.get("session").add_messages(turn(i))
+    # another worker sees the same history
+    assert contents(RedisHistoryStore("redis://history").get("session")) == [
+        "Question 1", "Answer 1", "Question 2", "Answer 2"
+    ]
+
+
+def test_redis_history_expires_after_the_last_write(redis_urls):
+    store = RedisHistoryStore("redis://history", ttl=1)
+    history = store.get("session")
+    history.add_messages(turn(0))
+    assert 0 < store.client.ttl(history.key) <= 1
+    time.sleep(1.1)
+    assert history.messages == []
+
+
+def test_memory_is_the_default_backend(monkeypatch):
+    monkeypatch.setattr(history_store, "HISTORY_BACKEND", "memory")
+    assert isinstance(history_store.create_history_store(), InMemoryHistoryStore)
+
+
+def test_redis_backend_uses_redis_url(monkeypatch, redis_urls):
+    monkeypatch.setattr(history_store, "HISTORY_BACKEND", "redis")
+    monkeypatch.setenv("REDIS_URL", "redis://history:6380")
+    assert isinstance(history_store.create_history_store(), RedisHistoryStore)
+    assert redis_urls == ["redis://history:6380"]
+
+
+def test_only_questions_and_answers_are_saved():
+    store = InMemoryHistoryStore()
+    model = FakeListChatModel(responses=["first", "second", "third"])
+    chain = with_trimmed_history(model, store.get, max_tokens=2000)
+    config = {"configurable": {"session_id": "session"}}
+
+    for turn_number in range(3):
+        messages = [SystemMessage(f"Context for turn {turn_number}"), HumanMessage(f"Question {turn_number}")]
+        chain.invoke(history_input(messages), config=config)
+
+    saved = store.get("session").messages
+    assert [type(message) for message in saved] == [HumanMessage, AIMessage] * 3
+    assert [message.content for message in saved[1::2]] == ["first", "second", "third"]
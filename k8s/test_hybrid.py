@@ -0,0 +1,39 @@
+import os
+
+import pytest
+from langchain_core.documents import Document
+
+from hybrid import HybridIndex
+
+CSV_PATH = os.path.join(os.path.dirname(__file__), "customers-1000.csv")
+
+
+@pytest.fixture(scope="module")
+def index():
+    return HybridIndex.from_csv(CSV_PATH)
+
+
+def test_customer_id_is_an_exact_match(index):
+    docs = index.exact_search("Tell me about customer dE014d010c7ab0c")
+    assert len(docs) == 1
+    assert "Customer Id: dE014d010c7ab0c" in docs[0].page_content
+
+
+def test_company_is_an_exact_match(index):
+    docs = index.exact_search("Which customers work at Stewart-Flynn?")
+    assert docs
+    assert all("Company: Stewart-Flynn" in doc.page_content for doc in docs)
+
+
+@pytest.mark.parametrize("question", [
+    "What is the capital of France?",
+    "How do I cook a turkey?",
+    "Who won the game in Chad?"
+])
+def test_country_question_reaches_the_vector_store(index, question):
+    # no exact match, so retrieve() runs the vector search and fuses it with the keyword results
+    assert index.exact_search(question) == []
+    vector_docs = [Document(page_content="The vector store's best match."), Document(page_content="Its second.")]
+    fused = index.fuse(question, vector_docs)
+    assert vector_docs[0] in fused
+    assert vector_docs[1] in fused
@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import httpx
+import pytest
+from langchain_openai import ChatOpenAI
+
+from router import MIN_HEDGE_SAMPLES, RoutedChatModel
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "bench"))
+import fake_openai  # noqa: E402
+
+SLOW = 0.5
+
+
+def fake_server(chat_latency):
+    """A fake OpenAI server that answers after chat_latency seconds."""
+    handler = type("Handler", (fake_openai.Handler,), {"options": argparse.Namespace(
+        chat_latency=chat_latency, token_latency=0.0, embed_latency=0.0, completion_tokens=5, dim=8
+    )})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def chat_model(port):
+    return ChatOpenAI(
+        model=f"backend-{port}",
+        base_url=f"http://127.0.0.1:{port}/v1",
+        api_key="not-needed",
+        max_retries=0,
+        cache=False,
+        # its own async client, the shared default one is bound to the first test's event loop
+        http_async_client=httpx.AsyncClient()
+    )
+
+
+@pytest.fixture(scope="module")
+def ports():
+    """Ports of a slow and a fast fake OpenAI server, and one nothing listens on."""
+    servers = [fake_server(SLOW), fake_server(0.0)]
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        closed_port = sock.getsockname()[1]
+    yield [server.server_port for server in servers] + [closed_port]
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def backends(ports):
+    """(slow, fast, failing) chat models."""
+    return [chat_model(port) for port in ports]
+
+
+def seed(router, i, latency, samples=MIN_HEDGE_SAMPLES):
+    """Records latency samples for backend i, as if it had already answered that fast."""
+    for _ in range(samples):
+        router._stats[i].record(latency, True)
+
+
+def test_requests_go_to_the_fastest_backend(backends):
+    slow, fast, _ = backends
+    router = RoutedChatModel(backends=[slow, fast])
+    # both backends are untried and tried once each, then the fast one is preferred
+    router.invoke("warm-up")
+    router.invoke("warm-up")
+    assert router._ranked() == [1, 0]
+    start = time.perf_counter()
+    for _ in range(3):
+        assert router.invoke("hello").content.startswith("Answer to: hello")
+    assert time.perf_counter() - start < SLOW
+    assert len(router._stats[0].latencies) == 1
+    assert len(router._stats[1].latencies) == 4
+
+
+def test_failed_request_fails_over(backends):
+    _, fast, failing = backends
+    router = RoutedChatModel(backends=[failing, fast])
+    assert router.invoke("hello").content.startswith("Answer to: hello")
+    assert list(router._stats[0].outcomes) == [False]
+    # it is now ranked behind the backend that answered
+    assert router._ranked() == [1, 0]
+
+
+def test_hedge_wins_and_cancels_the_slow_request(backends):
+    slow, fast, _ = backends
+    router = RoutedChatModel(backends=[slow, fast], hedge=True)
+    # the slow backend looks fastest, so it gets the request and is hedged after its p95
+    seed(router, 0, 0.01)
+    seed(router, 1, 0.02)
+    start = time.perf_counter()
+    response = asyncio.run(router.ainvoke("hello"))
+    assert time.perf_counter() - start < SLOW
+    assert response.content.startswith("Answer to: hello")
+    # the fast backend's hedge was recorded, the cancelled slow request was not
+    assert len(router._stats[1].latencies) == MIN_HEDGE_SAMPLES + 1
+    assert len(router._stats[0].outcomes) == MIN_HEDGE_SAMPLES
+
+
+def test_no_hedge_without_enough_samples(backends):
+    slow, fast, _ = backends
+    router = RoutedChatModel(backends=[slow, fast], hedge=True)
+    seed(router, 0, 0.01, samples=MIN_HEDGE_SAMPLES - 1)
+    seed(router, 1, 0.02)
+    start = time.perf_counter()
+    router.invoke("hello")
+    assert time.perf_counter() - start >= SLOW
+    assert len(router._stats[1].latencies) == MIN_HEDGE_SAMPLES
+
+
+def test_stream_fails_over_before_the_first_chunk(backends):
+    _, fast, failing = backends
+    router = RoutedChatModel(backends=[failing, fast])
+    assert "".join(chunk.content for chunk in router.stream("hello")).startswith("Answer to: hello")
+    assert list(router._stats[0].outcomes) == [False]
+
+
+def test_astream_fails_over_before_the_first_chunk(backends):
+    _, fast, failing = backends
+    router = RoutedChatModel(backends=[failing, fast])
+
+    async def collect():
+        return "".join([chunk.content async for chunk in router.astream("hello")])
+
+    assert asyncio.run(collect()).startswith("Answer to: hello")
+    assert list(router._stats[0].outcomes) == [False]
+
+
+def test_every_backend_failing_raises(backends):
+    _, _, failing = backends
+    router = RoutedChatModel(backends=[failing, failing])
+    with pytest.raises(Exception):
+        router.invoke("hello")
+    assert [list(stats.outcomes) for stats in router._stats] == [[False], [False]]
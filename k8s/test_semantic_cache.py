@@ -0,0 +1,34 @@
+import fakeredis
+import pytest
+import redis
+
+from semantic_cache import RedisSemanticAnswerCache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, "from_url", lambda url: fakeredis.FakeRedis(server=server))
+    return RedisSemanticAnswerCache("redis://cache", ttl=60, max_entries=3)
+
+
+def entries(cache, fingerprint):
+    return cache.client.lrange(f"{cache.prefix}:{fingerprint}", 0, -1)
+
+
+def test_entries_are_capped(cache):
+    for i in range(5):
+        cache.update(None, "docs", f"question {i}", f"answer {i}")
+    assert len(entries(cache, "docs")) == 3
+    assert cache.lookup(None, "docs", "question 0") is None
+    assert cache.lookup(None, "docs", "question 4") == "answer 4"
+
+
+def test_expired_entries_are_dropped_on_write(cache, monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr("semantic_cache.time.time", lambda: now)
+    cache.update(None, "docs", "old", "old answer")
+    now += 61
+    cache.update(None, "docs", "new", "new answer")
+    assert len(entries(cache, "docs")) == 1
+    assert cache.lookup(None, "docs", "new") == "new answer"
@@ -1,16 +1,13 @@
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from flask import Flask, request
 from opentelemetry.instrumentation.openai import OpenAIInstrumentor
 
 app = Flask(__name__)
 OpenAIInstrumentor().instrument()
 client = OpenAI()
+async_client = AsyncOpenAI()
 
-@app.route("/askquestion", methods=['POST'])
-def ask_question():
-
-    data = request.json
-    question = data.get('question')
+def answer_question(question):
 
     completion = client.chat.completions.create(
         model="gpt-3.5-turbo",
@@ -19,4 +16,24 @@ def ask_question():
         ]
     )
 
-    return completion.choices[0].message.content
\ No newline at end of file
+    return completion.choices[0].message.content
+
+# same as answer_question, used by the ASGI app in asgi.py
+async def aanswer_question(question):
+
+    completion = await async_client.chat.completions.create(
+        model="gpt-3.5-turbo",
+        messages=[
+            {"role": "user", "content": question}
+        ]
+    )
+
+    return completion.choices[0].message.content
+
+@app.route("/askquestion", methods=['POST'])
+def ask_question():
+
+    data = request.json
+    question = data.get('question')
+
+    return answer_question(question)
\ No newline at end of file
@@ -0,0 +1,21 @@
+# Async serving mode: the same /askquestion pipeline as app.py, served on a single
+# event loop so one process can hold many in-flight questions, e.g.
+#   splunk-py-trace uvicorn asgi:app --port 8080
+from opentelemetry.instrumentation.asgi import OpenTelemetryMiddleware
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from app import aanswer_question
+
+
+async def ask_question(request):
+    data = await request.json()
+    question = data.get('question')
+
+    return PlainTextResponse(await aanswer_question(question))
+
+
+app = OpenTelemetryMiddleware(
+    Starlette(routes=[Route("/askquestion", ask_question, methods=["POST"])])
+)
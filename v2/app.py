@@ -1,21 +1,70 @@
+import json
+import time
+
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
-from flask import Flask, request
+from flask import Flask, Response, request
+from opentelemetry import metrics
 from opentelemetry.instrumentation.langchain import LangchainInstrumentor
 
 app = Flask(__name__)
 LangchainInstrumentor().instrument()
 model = ChatOpenAI(model="gpt-3.5-turbo")
 
+meter = metrics.get_meter(__name__)
+time_to_first_token = meter.create_histogram(
+    "askquestion.time_to_first_token",
+    unit="s",
+    description="Time from receiving a streamed question to sending its first token"
+)
+
+def sse(token):
+    return f"data: {json.dumps(token)}\n\n"
+
+def build_messages(question):
+    return [
+        SystemMessage(content="You are a helpful assistant!"),
+        HumanMessage(content=question),
+    ]
+
+def answer_question(question):
+    return model.invoke(build_messages(question)).content
+
+# same as answer_question, used by the ASGI app in asgi.py
+async def aanswer_question(question):
+    return (await model.ainvoke(build_messages(question))).content
+
+# streaming variant of answer_question, yields the answer as server-sent events
+def stream_answer(question):
+    start = time.perf_counter()
+    first = True
+    for chunk in model.stream(build_messages(question)):
+        if not chunk.content:
+            continue
+        if first:
+            time_to_first_token.record(time.perf_counter() - start)
+            first = False
+        yield sse(chunk.content)
+
+async def astream_answer(question):
+    start = time.perf_counter()
+    first = True
+    async for chunk in model.astream(build_messages(question)):
+        if not chunk.content:
+            continue
+        if first:
+            time_to_first_token.record(time.perf_counter() - start)
+            first = False
+        yield sse(chunk.content)
+
 @app.route("/askquestion", methods=['POST'])
 def ask_question():
 
     data = request.json
     question = data.get('question')
 
-    messages = [
-        SystemMessage(content="You are a helpful assistant!"),
-        HumanMessage(content=question),
-    ]
+    # opt in to token streaming with {"stream": true}
+    if data.get('stream'):
+        return Response(stream_answer(question), mimetype="text/event-stream")
 
-    return model.invoke(messages).content
+    return answer_question(question)
@@ -1,40 +1,101 @@
+import json
+import os
+import time
+
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_core.chat_history import (
-    BaseChatMessageHistory,
-    InMemoryChatMessageHistory,
-)
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from flask import Flask, request
+from langchain_core.chat_history import BaseChatMessageHistory
+from flask import Flask, Response, request
+from opentelemetry import metrics
 from opentelemetry.instrumentation.langchain import LangchainInstrumentor
 
+from history_store import create_history_store, history_input, with_trimmed_history
+
 app = Flask(__name__)
 LangchainInstrumentor().instrument()
 model = ChatOpenAI(model="gpt-3.5-turbo")
 
-store = {}
-config = {"configurable": {"session_id": "test"}}
+# bounded, evicting session histories (HISTORY_BACKEND=redis to share them across processes)
+store = create_history_store()
 
 def get_session_history(session_id: str) -> BaseChatMessageHistory:
-    if session_id not in store:
-        store[session_id] = InMemoryChatMessageHistory()
-    return store[session_id]
+    return store.get(session_id)
 
-with_message_history = RunnableWithMessageHistory(model, get_session_history)
+# keep the prompt bounded as a conversation grows by dropping its oldest turns
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "2000"))
+with_message_history = with_trimmed_history(model, get_session_history, HISTORY_MAX_TOKENS)
 
-@app.route("/askquestion", methods=['POST'])
-def ask_question():
+meter = metrics.get_meter(__name__)
+time_to_first_token = meter.create_histogram(
+    "askquestion.time_to_first_token",
+    unit="s",
+    description="Time from receiving a streamed question to sending its first token"
+)
 
-    data = request.json
-    question = data.get('question')
+def sse(token):
+    return f"data: {json.dumps(token)}\n\n"
+
+def build_messages(question):
+    return [
+        SystemMessage(content="You are a helpful assistant"),
+        HumanMessage(content=question)
+    ]
+
+def answer_question(question, session_id):
+    config = {"configurable": {"session_id": session_id}}
 
     response = with_message_history.invoke(
-        [
-            SystemMessage(content="You are a helpful assistant"),
-            HumanMessage(content=question)
-        ],
+        history_input(build_messages(question)),
         config=config
     )
 
     return response.content
 
+# same as answer_question, used by the ASGI app in asgi.py
+async def aanswer_question(question, session_id):
+    config = {"configurable": {"session_id": session_id}}
+
+    response = await with_message_history.ainvoke(
+        history_input(build_messages(question)),
+        config=config
+    )
+
+    return response.content
+
+# streaming variant of answer_question, yields the answer as server-sent events
+def stream_answer(question, session_id):
+    config = {"configurable": {"session_id": session_id}}
+    start = time.perf_counter()
+    first = True
+    for chunk in with_message_history.stream(history_input(build_messages(question)), config=config):
+        if not chunk.content:
+            continue
+        if first:
+            time_to_first_token.record(time.perf_counter() - start)
+            first = False
+        yield sse(chunk.content)
+
+async def astream_answer(question, session_id):
+    config = {"configurable": {"session_id": session_id}}
+    start = time.perf_counter()
+    first = True
+    async for chunk in with_message_history.astream(history_input(build_messages(question)), config=config):
+        if not chunk.content:
+            continue
+        if first:
+            time_to_first_token.record(time.perf_counter() - start)
+            first = False
+        yield sse(chunk.content)
+
+@app.route("/askquestion", methods=['POST'])
+def ask_question():
+
+    data = request.json
+    question = data.get('question')
+    session_id = data.get('session_id', 'default')
+
+    # opt in to token streaming with {"stream": true}
+    if data.get('stream'):
+        return Response(stream_answer(question, session_id), mimetype="text/event-stream")
+
+    return answer_question(question, session_id)
@@ -0,0 +1,25 @@
+# Async serving mode: the same /askquestion pipeline as app.py, served on a single
+# event loop so one process can hold many in-flight questions, e.g.
+#   splunk-py-trace uvicorn asgi:app --port 8080
+from opentelemetry.instrumentation.asgi import OpenTelemetryMiddleware
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from app import aanswer_question, astream_answer
+
+
+async def ask_question(request):
+    data = await request.json()
+    question = data.get('question')
+    session_id = data.get('session_id', 'default')
+
+    if data.get('stream'):
+        return StreamingResponse(astream_answer(question, session_id), media_type="text/event-stream")
+
+    return PlainTextResponse(await aanswer_question(question, session_id))
+
+
+app = OpenTelemetryMiddleware(
+    Starlette(routes=[Route("/askquestion", ask_question, methods=["POST"])])
+)
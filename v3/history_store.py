@@ -0,0 +1,136 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.chat_history import BaseChatMessageHistory, InMemoryChatMessageHistory
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.runnables import RunnableLambda
+from langchain_core.runnables.history import RunnableWithMessageHistory
+
+from tokens import trim_history
+
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "memory")
+HISTORY_MAX_SESSIONS = int(os.getenv("HISTORY_MAX_SESSIONS", "10000"))
+HISTORY_TTL_SECONDS = float(os.getenv("HISTORY_TTL_SECONDS", "3600"))
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "50"))
+
+
+class BoundedChatMessageHistory(InMemoryChatMessageHistory):
+    """In-memory history that only keeps the most recent max_messages messages."""
+
+    max_messages: int = HISTORY_MAX_MESSAGES
+
+    def add_message(self, message):
+        self.messages.append(message)
+        if len(self.messages) > self.max_messages:
+            del self.messages[:len(self.messages) - self.max_messages]
+
+
+class InMemoryHistoryStore:
+    """Session histories kept in this process, evicted when least recently used or idle for ttl seconds."""
+
+    def __init__(
+        self,
+        max_sessions=HISTORY_MAX_SESSIONS,
+        ttl=HISTORY_TTL_SECONDS,
+        max_messages=HISTORY_MAX_MESSAGES
+    ):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            # sessions are ordered by last use, so expired ones are always at the front
+            while self._sessions:
+                oldest, (_, last_used) = next(iter(self._sessions.items()))
+                if now - last_used < self.ttl:
+                    break
+                del self._sessions[oldest]
+
+            entry = self._sessions.pop(session_id, None)
+            history = entry[0] if entry else BoundedChatMessageHistory(max_messages=self.max_messages)
+            self._sessions[session_id] = (history, now)
+
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return history
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class RedisChatMessageHistory(BaseChatMessageHistory):
+    """History kept in a Redis list, capped at max_messages and expiring ttl seconds after the last write."""
+
+    def __init__(self, client, session_id, ttl, max_messages, prefix="chat_history"):
+        self.client = client
+        self.key = f"{prefix}:{session_id}"
+        self.ttl = ttl
+        self.max_messages = max_messages
+
+    @property
+    def messages(self):
+        return messages_from_dict([json.loads(raw) for raw in self.client.lrange(self.key, 0, -1)])
+
+    def add_messages(self, messages):
+        if not messages:
+            return
+        pipe = self.client.pipeline()
+        pipe.rpush(self.key, *[json.dumps(message_to_dict(message)) for message in messages])
+        pipe.ltrim(self.key, -self.max_messages, -1)
+        pipe.expire(self.key, math.ceil(self.ttl))
+        pipe.execute()
+
+    def clear(self):
+        self.client.delete(self.key)
+
+
+class RedisHistoryStore:
+    """Session histories shared between workers and replicas through Redis."""
+
+    def __init__(self, redis_url, ttl=HISTORY_TTL_SECONDS, max_messages=HISTORY_MAX_MESSAGES):
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url)
+        self.ttl = ttl
+        self.max_messages = max_messages
+
+    def get(self, session_id):
+        return RedisChatMessageHistory(self.client, session_id, self.ttl, self.max_messages)
+
+
+def create_history_store():
+    # HISTORY_BACKEND=redis shares histories between gunicorn workers and k8s replicas
+    if HISTORY_BACKEND == "redis":
+        return RedisHistoryStore(os.getenv("REDIS_URL", "redis://127.0.0.1:6379"))
+    return InMemoryHistoryStore()
+
+
+def with_trimmed_history(model, get_session_history, max_tokens):
+    """model with each request's system messages, then the session's history trimmed to
+    max_tokens, then its question. Only the question and the answer are saved to the history;
+    the system messages, e.g. the retrieved context, are sent with each request but never
+    stored, so they don't crowd the earlier turns out of the budget.
+
+    Called with history_input(messages)."""
+    def prompt_messages(inputs):
+        return inputs["system"] + trim_history(inputs["history"], max_tokens, keep_last=0) + [inputs["question"]]
+
+    return RunnableWithMessageHistory(
+        RunnableLambda(prompt_messages) | model,
+        get_session_history,
+        input_messages_key="question",
+        history_messages_key="history"
+    )
+
+
+def history_input(messages):
+    """with_trimmed_history input for a request's messages, the last of which is the question."""
+    return {"system": messages[:-1], "question": messages[-1]}
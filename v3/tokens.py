@@ -0,0 +1,28 @@
+from langchain_core.messages import trim_messages
+
+
+# Rough token estimate of about four characters per token for English text. It is
+# only used for budgeting prompts, so it doesn't need a tokenizer for every model.
+def count_tokens(text):
+    return (len(text) + 3) // 4
+
+
+def count_message_tokens(messages):
+    # a few extra tokens per message for the role and separators
+    return sum(count_tokens(message.content if isinstance(message.content, str) else str(message.content)) + 4
+               for message in messages)
+
+
+def trim_history(messages, max_tokens, keep_last=2):
+    """Drop the oldest history turns so they fit in max_tokens. The last keep_last
+    messages belong to the current request and are always kept."""
+    split = len(messages) - keep_last
+    history, current = messages[:split], messages[split:]
+    history = trim_messages(
+        history,
+        max_tokens=max_tokens,
+        strategy="last",
+        token_counter=count_message_tokens,
+        start_on="human"
+    )
+    return history + current
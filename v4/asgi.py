@@ -0,0 +1,49 @@
+# Async serving mode: the same /askquestion pipeline as app.py, served on a single
+# event loop so one process can hold many in-flight questions, e.g.
+#   splunk-py-trace uvicorn asgi:app --port 8080
+from opentelemetry.instrumentation.asgi import OpenTelemetryMiddleware
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from admission import Overloaded, embedding_admission, llm_admission
+from app import aanswer_question, astream_answer, startup
+from stages import stage
+
+
+async def ask_question(request):
+    data = await request.json()
+    question = data.get('question')
+    session_id = data.get('session_id', 'default')
+
+    if data.get('stream'):
+        # the stream runs in another task once the response starts, so a full queue is
+        # checked up front to still answer with a 503 rather than a broken stream
+        embedding_admission.check()
+        llm_admission.check()
+        return StreamingResponse(astream_answer(question, session_id), media_type="text/event-stream")
+
+    answer = await aanswer_question(question, session_id)
+    with stage("serialize"):
+        return PlainTextResponse(answer)
+
+
+async def ready(request):
+    if startup.ready.is_set():
+        return PlainTextResponse("ready")
+    return PlainTextResponse("warming up", status_code=503)
+
+
+async def overloaded(request, e):
+    return PlainTextResponse("overloaded, retry later", status_code=503, headers={"Retry-After": str(e.retry_after)})
+
+
+app = OpenTelemetryMiddleware(
+    Starlette(
+        routes=[
+            Route("/askquestion", ask_question, methods=["POST"]),
+            Route("/ready", ready, methods=["GET"])
+        ],
+        exception_handlers={Overloaded: overloaded}
+    )
+)
@@ -0,0 +1,102 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+from opentelemetry import metrics
+
+# 0 (default) turns micro-batching off, e.g. EMBEDDING_BATCH_WINDOW_MS=5 to enable it
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "0"))
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "64"))
+EMBEDDING_BATCH_MAX_IN_FLIGHT = int(os.getenv("EMBEDDING_BATCH_MAX_IN_FLIGHT", "4"))
+
+meter = metrics.get_meter(__name__)
+batch_size = meter.create_histogram(
+    "embedding_batch.size",
+    unit="{query}",
+    description="Query embeddings sent to the embeddings endpoint in one batched request"
+)
+
+
+class MicroBatchingEmbeddings(Embeddings):
+    """Embeddings wrapper that collects concurrent embed_query calls for up to window_ms
+    and sends them to the underlying model as one embed_documents request.
+
+    Each caller waits for its own vector; sync and async callers share the same batches."""
+
+    def __init__(
+        self,
+        underlying,
+        window_ms=EMBEDDING_BATCH_WINDOW_MS,
+        max_batch_size=EMBEDDING_BATCH_MAX_SIZE,
+        max_in_flight=EMBEDDING_BATCH_MAX_IN_FLIGHT
+    ):
+        self.underlying = underlying
+        # keeps CachedEmbeddings keys the same with and without batching
+        self.model = getattr(underlying, "model", type(underlying).__name__)
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.max_in_flight = max_in_flight
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_started(self):
+        # started on first use, in the process that uses it (threads do not survive a fork)
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pool = ThreadPoolExecutor(max_workers=self.max_in_flight)
+                threading.Thread(target=self._collect, daemon=True).start()
+                self._pid = os.getpid()
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._pool.submit(self._flush, batch)
+
+    def _flush(self, batch):
+        # the same question asked by several callers is only embedded once
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        batch_size.record(len(texts))
+        try:
+            vectors = dict(zip(texts, self.underlying.embed_documents(texts)))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for text, future in batch:
+            future.set_result(vectors[text])
+
+    def _submit(self, text):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed_documents(self, texts):
+        # document embeddings are already batched by the caller
+        return self.underlying.embed_documents(texts)
+
+    async def aembed_documents(self, texts):
+        return await self.underlying.aembed_documents(texts)
+
+    def embed_query(self, text):
+        return self._submit(text).result()
+
+    async def aembed_query(self, text):
+        return await asyncio.wrap_future(self._submit(text))
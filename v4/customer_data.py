@@ -1,31 +1,67 @@
 import logging
+import os
 
-from langchain_community.document_loaders.csv_loader import CSVLoader
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores.chroma import Chroma
 
+from embedding_cache import CachedEmbeddings
+from ingest import incremental_ingest, ingest, iter_rows, row_hash, save_manifest
+from numpy_store import VECTOR_STORE, NumpyVectorStore
+
 logging.basicConfig(level=logging.DEBUG)
 
 file_path = (
    "./customers-1000.csv"
 )
 
-loader = CSVLoader(file_path=file_path)
-customer_data = loader.load()
+INGEST_MODE = os.getenv("INGEST_MODE", "full")
+MANIFEST_PATH = "../my_embeddings/manifest.json"
 
 # embeddings_model = OpenAIEmbeddings()
-embeddings_model = OpenAIEmbeddings(
+# rows that were already embedded by an earlier run are read back from the embedding cache
+embeddings_model = CachedEmbeddings(OpenAIEmbeddings(
     check_embedding_ctx_length=False,
     model="text-embedding-nomic-embed-text-v1.5",
     base_url="http://localhost:1234/v1",
     openai_api_key="not-needed"
-)
+))
 
-db = Chroma.from_documents(
-   customer_data,
-   embedding=embeddings_model,
-   persist_directory="../my_embeddings"
-)
+# "full" rebuilds the store in one pass, "stream" reads and embeds the CSV in batches,
+# "incremental" only embeds rows that changed since the last run and deletes removed rows
+if INGEST_MODE == "stream":
+    db = Chroma(
+        persist_directory="../my_embeddings",
+        embedding_function=embeddings_model
+    )
+    ingest(db, embeddings_model, iter_rows(file_path))
+elif INGEST_MODE == "incremental":
+    db = Chroma(
+        persist_directory="../my_embeddings",
+        embedding_function=embeddings_model
+    )
+    incremental_ingest(db, embeddings_model, iter_rows(file_path), MANIFEST_PATH)
+else:
+    # keyed on Customer Id like the other modes, so a later run upserts the same records
+    rows = list(iter_rows(file_path))
+
+    # start from an empty collection, so rows removed from the CSV since the last run are
+    # not left in the store, or in the manifest's view of it
+    Chroma(
+        persist_directory="../my_embeddings",
+        embedding_function=embeddings_model
+    ).delete_collection()
+    db = Chroma.from_documents(
+       [doc for _, doc in rows],
+       embedding=embeddings_model,
+       ids=[row_id for row_id, _ in rows],
+       persist_directory="../my_embeddings"
+    )
+    # an incremental run after this one only embeds the rows that changed
+    save_manifest(MANIFEST_PATH, {row_id: row_hash(doc) for row_id, doc in rows})
+
+# export the store for the apps' in-memory numpy index
+if VECTOR_STORE == "numpy":
+    NumpyVectorStore.from_chroma(db).save(os.getenv("NUMPY_INDEX_PATH", "../my_embeddings_numpy"))
 
 results = db.similarity_search(
    "Which customers are associated with the company Cherry and Sons?"
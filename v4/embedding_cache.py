@@ -0,0 +1,214 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+from opentelemetry import metrics
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "../embedding_cache.sqlite")
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", "10000"))
+EMBEDDING_CACHE_DISK_SIZE = int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", "1000000"))
+
+meter = metrics.get_meter(__name__)
+cache_requests = meter.create_counter(
+    "embedding_cache.requests",
+    description="Embedding cache lookups, by result (memory_hit, disk_hit or miss)"
+)
+
+
+def normalize(text):
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper with an in-process LRU tier in front of a size-bounded SQLite tier.
+
+    Entries are keyed by model name, query/document kind and normalized text, so the
+    same cache file can be shared by the apps and the ingestion scripts. The async methods
+    read and write the SQLite tier on a worker thread, so it never blocks the event loop."""
+
+    def __init__(
+        self,
+        underlying,
+        model_name=None,
+        path=EMBEDDING_CACHE_PATH,
+        memory_size=EMBEDDING_CACHE_MEMORY_SIZE,
+        disk_size=EMBEDDING_CACHE_DISK_SIZE
+    ):
+        self.underlying = underlying
+        self.model_name = model_name or getattr(underlying, "model", type(underlying).__name__)
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.stats = {"memory_hit": 0, "disk_hit": 0, "miss": 0}
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # SQLite is only used under its own lock, so memory hits never wait on the disk
+        self._disk_lock = threading.Lock()
+        self.path = path
+        self._connection = None
+        self._pid = None
+        self._connect()
+
+    def _connect(self):
+        """This process's SQLite connection, reopened after a fork since one can't be shared."""
+        if self.path and self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB, accessed REAL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed)")
+            self._connection.commit()
+            self._pid = os.getpid()
+        return self._connection
+
+    def _key(self, kind, text):
+        return f"{self.model_name}\x00{kind}\x00{normalize(text)}"
+
+    def _record(self, result, count=1):
+        self.stats[result] += count
+        cache_requests.add(count, {"result": result, "model": self.model_name})
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _lookup_memory(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+            self._record("memory_hit", len(found))
+        return found
+
+    def _lookup_disk(self, keys):
+        with self._disk_lock:
+            conn = self._connect()
+            if conn is None:
+                return {}
+            placeholders = ",".join("?" * len(keys))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", keys
+            ).fetchall()
+            if rows:
+                conn.execute(
+                    f"UPDATE embeddings SET accessed = ? WHERE key IN ({','.join('?' * len(rows))})",
+                    [time.time()] + [key for key, _ in rows]
+                )
+                conn.commit()
+        found = {key: array("f", blob).tolist() for key, blob in rows}
+        with self._lock:
+            for key, vector in found.items():
+                self._remember(key, vector)
+            self._record("disk_hit", len(found))
+        return found
+
+    def _lookup(self, keys):
+        found = self._lookup_memory(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            found.update(self._lookup_disk(missing))
+        return found
+
+    async def _alookup(self, keys):
+        found = self._lookup_memory(keys)
+        missing = [key for key in keys if key not in found]
+        if missing and self.path:
+            found.update(await asyncio.to_thread(self._lookup_disk, missing))
+        return found
+
+    def _store_memory(self, entries):
+        with self._lock:
+            for key, vector in entries.items():
+                self._remember(key, vector)
+
+    def _store_disk(self, entries):
+        with self._disk_lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            now = time.time()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, accessed) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in entries.items()]
+            )
+            # evict the least recently used tenth once the disk tier is over its bound
+            (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self.disk_size:
+                conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY accessed LIMIT ?)",
+                    (count - self.disk_size + self.disk_size // 10,)
+                )
+            conn.commit()
+
+    def _store(self, entries):
+        self._store_memory(entries)
+        self._store_disk(entries)
+
+    async def _astore(self, entries):
+        self._store_memory(entries)
+        if self.path:
+            await asyncio.to_thread(self._store_disk, entries)
+
+    def _missing(self, keys, texts, found):
+        # embed each distinct missing text once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            with self._lock:
+                self._record("miss", len(missing))
+        return missing
+
+    def embed_documents(self, texts):
+        keys = [self._key("document", text) for text in texts]
+        found = self._lookup(list(dict.fromkeys(keys)))
+        missing = self._missing(keys, texts, found)
+        if missing:
+            computed = dict(zip(missing, self.underlying.embed_documents(list(missing.values()))))
+            self._store(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    async def aembed_documents(self, texts):
+        keys = [self._key("document", text) for text in texts]
+        found = await self._alookup(list(dict.fromkeys(keys)))
+        missing = self._missing(keys, texts, found)
+        if missing:
+            computed = dict(zip(missing, await self.underlying.aembed_documents(list(missing.values()))))
+            await self._astore(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def _record_miss(self, vector):
+        if vector is None:
+            with self._lock:
+                self._record("miss")
+
+    def embed_query(self, text):
+        key = self._key("query", text)
+        vector = self._lookup([key]).get(key)
+        self._record_miss(vector)
+        if vector is None:
+            vector = self.underlying.embed_query(text)
+            self._store({key: vector})
+        return vector
+
+    async def aembed_query(self, text):
+        key = self._key("query", text)
+        vector = (await self._alookup([key])).get(key)
+        self._record_miss(vector)
+        if vector is None:
+            vector = await self.underlying.aembed_query(text)
+            await self._astore({key: vector})
+        return vector
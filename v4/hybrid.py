@@ -0,0 +1,108 @@
+import csv
+import heapq
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+from ingest import ID_COLUMN, row_document
+
+# "vector" (default) only uses the vector store, "hybrid" adds exact-field and keyword retrieval
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+
+# fields that name one customer, so a match answers the question without the vector store.
+# Tried in this order, so an id match wins over a company match. Broader fields such as
+# Country are left to the keyword search, whose results are fused with the vector results.
+EXACT_FIELDS = (ID_COLUMN, "Company")
+EXACT_MAX_RESULTS = int(os.getenv("EXACT_MAX_RESULTS", "10"))
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "by", "company", "customer", "customers", "for", "from",
+    "in", "is", "me", "of", "on", "or", "tell", "the", "to", "what", "which", "who", "with"
+}
+
+# BM25 parameters and the reciprocal rank fusion constant
+K1 = 1.5
+B = 0.75
+RRF_K = 60
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class HybridIndex:
+    """Exact indexes on structured CSV fields plus a BM25 index over whole rows.
+
+    Questions naming a customer id or company are answered from the exact indexes without an
+    embedding call; other questions fuse the BM25 and vector results with reciprocal rank fusion."""
+
+    def __init__(self, rows):
+        self.documents = []
+        self.exact = {field: defaultdict(list) for field in EXACT_FIELDS}
+        self.longest = {field: 1 for field in EXACT_FIELDS}
+        self.postings = defaultdict(list)
+        self.lengths = []
+
+        for row, doc in rows:
+            i = len(self.documents)
+            self.documents.append(doc)
+            for field in EXACT_FIELDS:
+                tokens = tokenize(row.get(field, ""))
+                if tokens:
+                    self.exact[field][" ".join(tokens)].append(i)
+                    self.longest[field] = max(self.longest[field], len(tokens))
+            counts = Counter(tokenize(doc.page_content))
+            for token, tf in counts.items():
+                self.postings[token].append((i, tf))
+            self.lengths.append(sum(counts.values()))
+
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    @classmethod
+    def from_csv(cls, file_path):
+        with open(file_path, newline="", encoding="utf-8") as csvfile:
+            return cls((row, row_document(row, i, file_path)) for i, row in enumerate(csv.DictReader(csvfile)))
+
+    def exact_search(self, question):
+        """Rows whose Customer Id or Company appears verbatim in the question."""
+        tokens = tokenize(question)
+        for field in EXACT_FIELDS:
+            index = self.exact[field]
+            matches = []
+            # longest n-grams first, so "Cherry and Sons" wins over "Sons"
+            for n in range(min(self.longest[field], len(tokens)), 0, -1):
+                for start in range(len(tokens) - n + 1):
+                    gram = tokens[start:start + n]
+                    if n == 1 and gram[0] in STOPWORDS:
+                        continue
+                    matches.extend(index.get(" ".join(gram), ()))
+                if matches:
+                    seen = dict.fromkeys(matches)
+                    return [self.documents[i] for i in list(seen)[:EXACT_MAX_RESULTS]]
+        return []
+
+    def keyword_search(self, question, k=4):
+        scores = defaultdict(float)
+        total = len(self.documents)
+        for token in set(tokenize(question)) - STOPWORDS:
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, tf in postings:
+                norm = K1 * (1 - B + B * self.lengths[i] / self.average_length)
+                scores[i] += idf * tf * (K1 + 1) / (tf + norm)
+        return [self.documents[i] for i in heapq.nlargest(k, scores, key=scores.get)]
+
+    def fuse(self, question, vector_docs, k=4):
+        """Merge the vector results with the BM25 results using reciprocal rank fusion."""
+        fused = defaultdict(float)
+        docs = {}
+        for results in (vector_docs, self.keyword_search(question, k)):
+            for rank, doc in enumerate(results):
+                # documents from Chroma may have different ids, so match on content
+                docs.setdefault(doc.page_content, doc)
+                fused[doc.page_content] += 1.0 / (RRF_K + rank + 1)
+        return [docs[key] for key in heapq.nlargest(k, fused, key=fused.get)]
@@ -0,0 +1,103 @@
+import contextvars
+import os
+import random
+import time
+from contextlib import contextmanager
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from opentelemetry import metrics, trace
+
+from tokens import count_message_tokens, count_tokens
+
+# fraction of stages recorded in the stage_duration histogram, spans follow the tracer's sampler
+STAGE_METRICS_SAMPLE_RATE = float(os.getenv("STAGE_METRICS_SAMPLE_RATE", "1.0"))
+
+tracer = trace.get_tracer(__name__)
+meter = metrics.get_meter(__name__)
+stage_duration = meter.create_histogram(
+    "askquestion.stage_duration",
+    unit="s",
+    description="Time spent in each stage of answering a question, excluding nested stages"
+)
+
+_current = contextvars.ContextVar("stage", default=None)
+
+
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.attributes = {}
+        self.nested = 0.0
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def set_usage(self, messages, response):
+        """Prompt and completion token counts, from the model's usage metadata when it has them."""
+        usage = getattr(response, "usage_metadata", None)
+        content = response if isinstance(response, str) else response.content
+        self.set("prompt_tokens", usage["input_tokens"] if usage else count_message_tokens(messages))
+        self.set("completion_tokens", usage["output_tokens"] if usage else count_tokens(content))
+
+
+@contextmanager
+def stage(name, **attributes):
+    """Time one stage of the pipeline as a span and in the stage_duration histogram.
+
+    attributes go on both and must be low-cardinality; values set on the yielded
+    Stage, like token counts, only go on the span."""
+    current = Stage(name)
+    parent = _current.get()
+    token = _current.set(current)
+    start = time.perf_counter()
+    with tracer.start_as_current_span(f"askquestion.{name}", attributes=attributes) as span:
+        try:
+            yield current
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            span.set_attributes(current.attributes)
+            if parent is not None:
+                parent.nested += elapsed
+            if random.random() < STAGE_METRICS_SAMPLE_RATE:
+                stage_duration.record(elapsed - current.nested, {"stage": name, **attributes})
+
+
+class StagedChatMessageHistory(BaseChatMessageHistory):
+    """Times reading and writing a session history as the history_load and history_save stages."""
+
+    def __init__(self, history):
+        self.history = history
+
+    @property
+    def messages(self):
+        with stage("history_load") as current:
+            messages = self.history.messages
+            current.set("messages", len(messages))
+        return messages
+
+    def add_messages(self, messages):
+        with stage("history_save"):
+            self.history.add_messages(messages)
+
+    def clear(self):
+        self.history.clear()
+
+
+def use_in_memory_exporters():
+    """Send spans and metrics to in-memory exporters instead of a collector, to look at the
+    stages offline. Call it before importing the app; returns (span exporter, metric reader)."""
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    span_exporter = InMemorySpanExporter()
+    tracer_provider = TracerProvider()
+    tracer_provider.add_span_processor(SimpleSpanProcessor(span_exporter))
+    trace.set_tracer_provider(tracer_provider)
+
+    metric_reader = InMemoryMetricReader()
+    metrics.set_meter_provider(MeterProvider(metric_readers=[metric_reader]))
+    return span_exporter, metric_reader
@@ -1,20 +1,38 @@
+# imported first so the startup report includes the time spent importing the libraries below
+from startup import startup
+
+import json
 import os
-import random
-from flask import Flask, request
+import time
+from flask import Flask, Response, request
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_core.chat_history import InMemoryChatMessageHistory, BaseChatMessageHistory
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_chroma import Chroma
 from langchain.tools import tool
 from langchain.agents import create_react_agent, AgentExecutor
-from langchain import hub
 
+from opentelemetry import metrics
 from opentelemetry.instrumentation.langchain import LangchainInstrumentor
 
+from embedding_cache import CachedEmbeddings
+from history_store import create_history_store
+from numpy_store import VECTOR_STORE, NumpyVectorStore
+from metadata_index import MetadataIndex
+from fanout import FANOUT_RETRIEVAL, FanOutRetriever
+from tool_cache import cached_tool
+from react_prompt import react_prompt
+from react_parser import TolerantReActParser
+from intent_router import AGENT, INTENT_ROUTING, IntentRouter
+from tokens import trim_history
+
+startup.mark("imports")
+
 # Initialize Flask app and OpenTelemetry
 app = Flask(__name__)
 
 LangchainInstrumentor().instrument()
+startup.mark("telemetry")
 
 # Initialize the language model (local Llama 3.2)
 model = ChatOpenAI(
@@ -24,60 +42,101 @@ model = ChatOpenAI(
     api_key="not-needed"
 )
 
-# Initialize embeddings model
-embeddings_model = OpenAIEmbeddings(
+# Initialize embeddings model, cached so repeated tool queries skip the embeddings endpoint
+embeddings_model = CachedEmbeddings(OpenAIEmbeddings(
     check_embedding_ctx_length=False,
     model="text-embedding-nomic-embed-text-v1.5",
     base_url="http://localhost:1234/v1",
     openai_api_key="not-needed"
-)
+))
+startup.mark("clients")
 
 # Set up multiple vector databases
-company_db = Chroma(
-    persist_directory="../company_embeddings",
-    embedding_function=embeddings_model
-)
+# VECTOR_STORE=numpy answers searches from in-memory indexes exported with numpy_store.py
+if VECTOR_STORE == "numpy":
+    company_db = NumpyVectorStore.load("../company_embeddings_numpy", embeddings_model)
+    general_db = NumpyVectorStore.load("../general_knowledge_embeddings_numpy", embeddings_model)
+else:
+    # chromadb is only imported when it is used
+    from langchain_chroma import Chroma
 
-general_db = Chroma(
-    persist_directory="../general_knowledge_embeddings",
-    embedding_function=embeddings_model
-)
+    company_db = Chroma(
+        persist_directory="../company_embeddings",
+        embedding_function=embeddings_model
+    )
 
-# Define tools
+    general_db = Chroma(
+        persist_directory="../general_knowledge_embeddings",
+        embedding_function=embeddings_model
+    )
+
+startup.mark("vector_stores")
+
+# Distinct company names for /random, read once here instead of reading every metadata
+# record of the collection on each request. It only reads local metadata, so it is built
+# before the app serves anything rather than in the warm-up, where /random would find it
+# empty. It is a snapshot of the store at startup: companies ingested later are not in it.
+company_index = MetadataIndex.from_store(company_db, ["company_name"])
+startup.mark("metadata_index")
+
+# Define tools, caching their results so repeated agent queries skip the vector search
 @tool
+@cached_tool()
 def company_info(query: str) -> str:
     """Retrieve information about companies from the company vector database."""
     docs = company_db.similarity_search(query)
     return "\n".join([doc.page_content for doc in docs])
 
 @tool
+@cached_tool(ttl=3600)
 def general_knowledge(query: str) -> str:
     """Retrieve general knowledge information from the general knowledge vector database."""
     docs = general_db.similarity_search(query)
     return "\n".join([doc.page_content for doc in docs])
 
+# Searches both databases at once with one embedding of the query
+fanout = FanOutRetriever({"company": company_db, "general": general_db}, embeddings_model)
+
+@tool
+@cached_tool()
+def search_all(query: str) -> str:
+    """Retrieve information about companies and general knowledge from all vector databases at once."""
+    return fanout.format(query)
+
 @tool
 def web_search_tool(query: str) -> str:
     """Perform a simulated web search (replace with real API in production)."""
     return f"Web search results for '{query}': [simulated results]"
 
 # List of tools for the agent
-tools = [company_info, general_knowledge, web_search_tool]
+# FANOUT_RETRIEVAL=false gives the agent one retrieval tool per database instead
+if FANOUT_RETRIEVAL:
+    tools = [search_all, web_search_tool]
+else:
+    tools = [company_info, general_knowledge, web_search_tool]
 
-# Set up the agent with ReAct prompt
-prompt = hub.pull("hwchase17/react")
-# output the fetched prompt
+# Set up the agent with ReAct prompt, a local copy unless REACT_PROMPT_SOURCE=hub
+prompt = react_prompt()
+# output the prompt
 print(prompt)
-agent = create_react_agent(model, tools, prompt)
-agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
+# near-miss model output is repaired by the parser, the rest is sent back to the model
+# instead of ending the run
+parser = TolerantReActParser(tool_names=[t.name for t in tools])
+agent = create_react_agent(model, tools, prompt, output_parser=parser)
+agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True, handle_parsing_errors=True)
 
 # Chat history management
-store = {}
+# bounded, evicting session histories (HISTORY_BACKEND=redis to share them across processes)
+store = create_history_store()
 
 def get_session_history(session_id: str) -> BaseChatMessageHistory:
-    if session_id not in store:
-        store[session_id] = InMemoryChatMessageHistory()
-    return store[session_id]
+    return store.get(session_id)
+
+def remember(session_id, question, answer):
+    get_session_history(session_id).add_messages([HumanMessage(content=question), AIMessage(content=answer)])
+
+async def aremember(session_id, question, answer):
+    await get_session_history(session_id).aadd_messages([HumanMessage(content=question), AIMessage(content=answer)])
 
 # Wrap agent with message history
 with_message_history = RunnableWithMessageHistory(
@@ -87,12 +146,67 @@ with_message_history = RunnableWithMessageHistory(
     history_messages_key="chat_history"
 )
 
-# API endpoint to handle questions
-@app.route("/askquestion", methods=['POST'])
-def ask_question():
-    data = request.json
-    question = data.get('question')
-    session_id = data.get('session_id', 'default')
+meter = metrics.get_meter(__name__)
+time_to_first_token = meter.create_histogram(
+    "askquestion.time_to_first_token",
+    unit="s",
+    description="Time from receiving a streamed question to sending its first agent step"
+)
+
+def agent_events(chunk):
+    """Turn an AgentExecutor stream chunk into server-sent events."""
+    for action in chunk.get("actions", []):
+        yield "action", {"tool": action.tool, "tool_input": action.tool_input, "log": action.log}
+    for step in chunk.get("steps", []):
+        yield "observation", {"tool": step.action.tool, "observation": str(step.observation)}
+    if "output" in chunk:
+        yield "answer", chunk["output"]
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Questions that clearly match one retriever skip the agent: the retriever's results and the
+# question go to the model in a single completion. INTENT_ROUTING=false always uses the agent.
+intent_router = IntentRouter(embeddings_model) if INTENT_ROUTING else None
+direct_stores = {"company": company_db, "general": general_db}
+
+# history sent with a direct answer, so follow-up questions keep the conversation
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "2000"))
+
+def direct_messages(question, context, history):
+    messages = trim_history(history + [HumanMessage(content=question)], HISTORY_MAX_TOKENS, keep_last=1)
+    return [SystemMessage(content=f"Use the following pieces of context to answer the question:\n{context}")] + messages
+
+def direct_context(decision, question):
+    if decision.route == "web":
+        return web_search_tool.invoke(question)
+    # the router already embedded the question
+    docs = direct_stores[decision.route].similarity_search_by_vector(decision.embedding)
+    return "\n".join(doc.page_content for doc in docs)
+
+async def adirect_context(decision, question):
+    if decision.route == "web":
+        return await web_search_tool.ainvoke(question)
+    docs = await direct_stores[decision.route].asimilarity_search_by_vector(decision.embedding)
+    return "\n".join(doc.page_content for doc in docs)
+
+def route(question):
+    return intent_router.route(question) if intent_router else None
+
+async def aroute(question):
+    return await intent_router.aroute(question) if intent_router else None
+
+def is_direct(decision):
+    return decision is not None and decision.route != AGENT
+
+def answer_question(question, session_id):
+    decision = route(question)
+    if is_direct(decision):
+        history = get_session_history(session_id).messages
+        answer = model.invoke(direct_messages(question, direct_context(decision, question), history)).content
+        remember(session_id, question, answer)
+        return answer
+
     config = {"configurable": {"session_id": session_id}}
     response = with_message_history.invoke(
         {"input": question},
@@ -100,13 +214,117 @@ def ask_question():
     )
     return response['output']
 
+# same as answer_question, used by the ASGI app in asgi.py
+async def aanswer_question(question, session_id):
+    decision = await aroute(question)
+    if is_direct(decision):
+        history = await get_session_history(session_id).aget_messages()
+        messages = direct_messages(question, await adirect_context(decision, question), history)
+        answer = (await model.ainvoke(messages)).content
+        await aremember(session_id, question, answer)
+        return answer
+
+    config = {"configurable": {"session_id": session_id}}
+    response = await with_message_history.ainvoke(
+        {"input": question},
+        config=config
+    )
+    return response['output']
+
+# streaming variant of answer_question, yields each intermediate agent step as it happens
+# direct answers are streamed as token events, followed by the whole answer
+def stream_answer(question, session_id):
+    start = time.perf_counter()
+    decision = route(question)
+    if is_direct(decision):
+        history = get_session_history(session_id).messages
+        tokens = []
+        for chunk in model.stream(direct_messages(question, direct_context(decision, question), history)):
+            if not chunk.content:
+                continue
+            if not tokens:
+                time_to_first_token.record(time.perf_counter() - start)
+            tokens.append(chunk.content)
+            yield sse("token", chunk.content)
+        remember(session_id, question, "".join(tokens))
+        yield sse("answer", "".join(tokens))
+        return
+
+    config = {"configurable": {"session_id": session_id}}
+    first = True
+    for chunk in with_message_history.stream({"input": question}, config=config):
+        for event, data in agent_events(chunk):
+            if first:
+                time_to_first_token.record(time.perf_counter() - start)
+                first = False
+            yield sse(event, data)
+
+async def astream_answer(question, session_id):
+    start = time.perf_counter()
+    decision = await aroute(question)
+    if is_direct(decision):
+        history = await get_session_history(session_id).aget_messages()
+        messages = direct_messages(question, await adirect_context(decision, question), history)
+        tokens = []
+        async for chunk in model.astream(messages):
+            if not chunk.content:
+                continue
+            if not tokens:
+                time_to_first_token.record(time.perf_counter() - start)
+            tokens.append(chunk.content)
+            yield sse("token", chunk.content)
+        await aremember(session_id, question, "".join(tokens))
+        yield sse("answer", "".join(tokens))
+        return
+
+    config = {"configurable": {"session_id": session_id}}
+    first = True
+    async for chunk in with_message_history.astream({"input": question}, config=config):
+        for event, data in agent_events(chunk):
+            if first:
+                time_to_first_token.record(time.perf_counter() - start)
+                first = False
+            yield sse(event, data)
+
+def random_company_name():
+    return company_index.sample("company_name")
+
+startup.mark("agent")
+
+# the first model, embeddings and vector store requests are made here rather than in a user's request
+warm_up_steps = [
+    ("embeddings", lambda: embeddings_model.embed_query("warm-up")),
+    ("vector_stores", lambda: fanout.search("warm-up")),
+    ("model", lambda: model.invoke("Reply with OK"))
+]
+if intent_router is not None:
+    warm_up_steps.append(("intent_router", intent_router.prepare))
+startup.warm_up(warm_up_steps)
+
+# readiness probe, 503 until the warm-up is done
+@app.route("/ready", methods=['GET'])
+def ready():
+    if startup.ready.is_set():
+        return "ready"
+    return "warming up", 503
+
+# API endpoint to handle questions
+@app.route("/askquestion", methods=['POST'])
+def ask_question():
+    data = request.json
+    question = data.get('question')
+    session_id = data.get('session_id', 'default')
+    # opt in to streaming the agent steps with {"stream": true}
+    if data.get('stream'):
+        return Response(stream_answer(question, session_id), mimetype="text/event-stream")
+    return answer_question(question, session_id)
+
 # API endpoint to return a random company name
 @app.route('/random', methods=['GET'])
 def random_company():
-    all_metadatas = company_db.get()['metadatas']
-    company_names = list(set([meta.get("company_name") for meta in all_metadatas if meta.get("company_name")]))
-    if company_names:
-        return random.choice(company_names)
+    company_name = random_company_name()
+    if company_name:
+        return company_name
     else:
         return "No companies found", 404
 
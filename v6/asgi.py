@@ -0,0 +1,42 @@
+# Async serving mode: the same endpoints as app.py, served on a single event loop
+# so one process can hold many in-flight questions, e.g.
+#   splunk-py-trace uvicorn asgi:app --port 8080
+from opentelemetry.instrumentation.asgi import OpenTelemetryMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from app import aanswer_question, astream_answer, random_company_name, startup
+
+
+async def ask_question(request):
+    data = await request.json()
+    question = data.get('question')
+    session_id = data.get('session_id', 'default')
+    if data.get('stream'):
+        return StreamingResponse(astream_answer(question, session_id), media_type="text/event-stream")
+    return PlainTextResponse(await aanswer_question(question, session_id))
+
+
+async def random_company(request):
+    company_name = await run_in_threadpool(random_company_name)
+    if company_name:
+        return PlainTextResponse(company_name)
+    else:
+        return PlainTextResponse("No companies found", status_code=404)
+
+
+async def ready(request):
+    if startup.ready.is_set():
+        return PlainTextResponse("ready")
+    return PlainTextResponse("warming up", status_code=503)
+
+
+app = OpenTelemetryMiddleware(
+    Starlette(routes=[
+        Route("/askquestion", ask_question, methods=["POST"]),
+        Route("/random", random_company, methods=["GET"]),
+        Route("/ready", ready, methods=["GET"]),
+    ])
+)
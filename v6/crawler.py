@@ -0,0 +1,181 @@
+import logging
+import os
+import sys
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+import requests
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from ingest import incremental_ingest
+
+logger = logging.getLogger(__name__)
+
+CRAWL_ROOT_URL = os.getenv("CRAWL_ROOT_URL", "https://docs.splunk.com/Documentation")
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "500"))
+CRAWL_MAX_WORKERS = int(os.getenv("CRAWL_MAX_WORKERS", "8"))
+CRAWL_MANIFEST_PATH = os.getenv("CRAWL_MANIFEST_PATH", "../splunk_embeddings/crawl_manifest.json")
+
+# links followed per page, and the size of the chunks that are embedded
+CRAWL_MAX_LINKS = 200
+CHUNK_SIZE = 1500
+CHUNK_OVERLAP = 150
+# responses that mean a page is gone for good, rather than failed to fetch this time
+GONE_STATUS_CODES = {404, 410}
+
+splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
+def product_from_url(url):
+    """Product name from a documentation URL, e.g. .../Documentation/Splunk/9.3.1/... -> Splunk."""
+    parts = [part for part in urlparse(url).path.split("/") if part]
+    if "Documentation" in parts:
+        parts = parts[parts.index("Documentation") + 1:]
+    return parts[0] if parts else urlparse(url).hostname
+
+
+class CrawlStatus:
+    """What a crawl could and couldn't see, to tell pages that are gone from pages it missed."""
+
+    def __init__(self):
+        self.fetched = set()
+        # pages that answered 404 or 410, and pages that failed to fetch
+        self.gone = set()
+        self.failed = set()
+        # stopped at max_pages with links left to follow
+        self.truncated = False
+
+    @property
+    def complete(self):
+        """True when every page linked from root_url was fetched, so pages the crawl didn't
+        see are no longer linked."""
+        return not self.truncated and not self.failed
+
+    def is_gone(self, url):
+        return url in self.gone or (self.complete and url not in self.fetched)
+
+
+def _fetch(fetcher, url):
+    try:
+        return url, fetcher.fetch(url, max_chars=None, max_links=CRAWL_MAX_LINKS), None
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code in GONE_STATUS_CODES:
+            logger.info("gone %s: %s", url, e)
+            return url, None, "gone"
+        logger.warning("skipping %s: %s", url, e)
+        return url, None, "failed"
+    except requests.RequestException as e:
+        logger.warning("skipping %s: %s", url, e)
+        return url, None, "failed"
+
+
+def crawl(fetcher, root_url=CRAWL_ROOT_URL, max_pages=CRAWL_MAX_PAGES, max_workers=CRAWL_MAX_WORKERS, status=None):
+    """Breadth-first crawl of the pages under root_url with at most max_workers fetches
+    in flight. Yields each page as soon as it is fetched, once per final (post-redirect) URL.
+
+    status, if given, is a CrawlStatus filled in as the crawl goes."""
+    status = status if status is not None else CrawlStatus()
+    seen = {root_url}
+    queue = deque([root_url])
+    pending = set()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while queue or pending:
+            while queue and len(pending) < max_workers and len(status.fetched) + len(pending) < max_pages:
+                pending.add(pool.submit(_fetch, fetcher, queue.popleft()))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                url, page, error = future.result()
+                if error == "gone":
+                    status.gone.add(url)
+                    continue
+                if error:
+                    status.failed.add(url)
+                    continue
+                # links that redirect to a page already crawled
+                if page["url"] in status.fetched:
+                    continue
+                status.fetched.add(page["url"])
+                seen.add(page["url"])
+                yield page
+                for link, _ in page["links"]:
+                    if link not in seen and link.startswith(root_url):
+                        seen.add(link)
+                        queue.append(link)
+
+    status.truncated = bool(queue)
+    logger.info(
+        "crawled %d pages from %s, %d gone, %d failed%s",
+        len(status.fetched), root_url, len(status.gone), len(status.failed),
+        ", stopped at max_pages" if status.truncated else ""
+    )
+
+
+def iter_chunks(pages):
+    """(id, Document) pairs for the chunks of each page, keyed on URL and chunk number."""
+    for page in pages:
+        product = product_from_url(page["url"])
+        for i, chunk in enumerate(splitter.split_text(page["content"])):
+            metadata = {"url": page["url"], "product": product, "chunk": i}
+            yield f"{page['url']}#{i}", Document(page_content=chunk, metadata=metadata)
+
+
+def crawl_and_index(
+    db,
+    embeddings_model,
+    fetcher,
+    root_url=CRAWL_ROOT_URL,
+    max_pages=CRAWL_MAX_PAGES,
+    manifest_path=CRAWL_MANIFEST_PATH,
+    on_upsert=None,
+    on_delete=None
+):
+    """Crawl root_url and embed the page chunks into db. Only chunks that changed since the
+    last run are embedded again.
+
+    Chunks are deleted only for pages that are known to be gone: pages that answered 404 or
+    410, and pages no longer linked from a crawl that fetched everything it found. Pages that
+    failed to fetch or that a crawl stopped at max_pages didn't reach keep their chunks."""
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    status = CrawlStatus()
+    rows = iter_chunks(crawl(fetcher, root_url, max_pages, status=status))
+
+    def can_delete(chunk_id):
+        url = chunk_id.rsplit("#", 1)[0]
+        # a page crawled this time has fewer chunks than before
+        return url in status.fetched or status.is_gone(url)
+
+    return incremental_ingest(
+        db,
+        embeddings_model,
+        rows,
+        manifest_path,
+        on_upsert=on_upsert,
+        can_delete=can_delete,
+        on_delete=on_delete
+    )
+
+
+if __name__ == '__main__':
+    # e.g. python crawler.py https://docs.splunk.com/Documentation
+    from langchain_chroma import Chroma
+    from langchain_openai import OpenAIEmbeddings
+
+    from embedding_cache import CachedEmbeddings
+    from fetcher import Fetcher
+
+    logging.basicConfig(level=logging.INFO)
+
+    root_url = sys.argv[1] if len(sys.argv) > 1 else CRAWL_ROOT_URL
+    embeddings_model = CachedEmbeddings(OpenAIEmbeddings(
+        check_embedding_ctx_length=False,
+        model="text-embedding-nomic-embed-text-v1.5",
+        base_url="http://localhost:1234/v1",
+        openai_api_key="not-needed"
+    ))
+    docs_db = Chroma(persist_directory="../splunk_embeddings", embedding_function=embeddings_model)
+    crawl_and_index(docs_db, embeddings_model, Fetcher(link_host=urlparse(root_url).hostname), root_url)
@@ -1,14 +1,17 @@
+# imported first so the startup report includes the time spent importing the libraries below
+from startup import startup
+
+import json
 import os
-import requests
-import random
-from bs4 import BeautifulSoup
-from flask import Flask, request, jsonify
+import threading
+import time
+from flask import Flask, Response, request, jsonify
 
 # -----------------------------
 # LangChain and Observability
 # -----------------------------
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_core.chat_history import InMemoryChatMessageHistory, BaseChatMessageHistory
+from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_chroma import Chroma
 from langchain.tools import tool
@@ -19,8 +22,20 @@ from langchain_core.documents import Document
 # from langchain.callbacks.stdout import StdOutCallbackHandler
 
 # Optional: OpenTelemetry instrumentation for observability of your chain
+from opentelemetry import metrics
 from opentelemetry.instrumentation.langchain import LangchainInstrumentor
 
+from embedding_cache import CachedEmbeddings
+from history_store import create_history_store
+from metadata_index import MetadataIndex
+from tool_cache import cached_tool
+from fetcher import Fetcher
+from crawler import crawl_and_index
+from react_prompt import REACT_TEMPLATE
+from react_parser import TolerantReActParser
+
+startup.mark("imports")
+
 # -----------------------------
 # Flask App
 # -----------------------------
@@ -31,6 +46,7 @@ app = Flask(__name__)
 # -----------------------------
 otel_endpoint = os.getenv("OTEL_EXPORTER_OTLP_HTTP_ENDPOINT", "http://127.0.0.1:4318")
 LangchainInstrumentor().instrument()
+startup.mark("telemetry")
 
 # -----------------------------
 # Model and Embeddings Setup
@@ -43,13 +59,13 @@ model = ChatOpenAI(
     # callbacks=[StdOutCallbackHandler()],
 )
 
-# Embeddings model
-embeddings_model = OpenAIEmbeddings(
+# Embeddings model, cached so repeated queries skip the embeddings endpoint
+embeddings_model = CachedEmbeddings(OpenAIEmbeddings(
     check_embedding_ctx_length=False,
     model="text-embedding-nomic-embed-text-v1.5",
     base_url="http://localhost:1234/v1",
     openai_api_key="not-needed"
-)
+))
 
 # -----------------------------
 # Documentation Embeddings
@@ -59,40 +75,45 @@ docs = [
 ]
 
 documents = [
-    Document(page_content=doc["desc"], metadata={"doc": doc["name"], "url": doc["url"]})
+    Document(page_content=doc["desc"], metadata={"doc": doc["name"], "url": doc["url"], "product": doc["name"]})
     for doc in docs
 ]
 
-docs_db = Chroma.from_documents(
-    documents=documents,
-    embedding=embeddings_model,
-    persist_directory="../splunk_embeddings"
+# the store is filled by crawler.py
+docs_db = Chroma(
+    persist_directory="../splunk_embeddings",
+    embedding_function=embeddings_model
 )
 
+# Distinct product names for /random, filled during the warm-up and kept up to date by the crawler
+product_index = MetadataIndex(["product"])
+
+def prepare_docs_db():
+    # only seed the store when it is still empty
+    if not docs_db.get(limit=1)["ids"]:
+        docs_db.add_documents(documents, ids=[doc.metadata["url"] for doc in documents])
+    product_index.add_store(docs_db)
+
+startup.mark("docs_db")
+
 # -----------------------------
 # Constants and Tools
 # -----------------------------
 ROOT_URL = "https://docs.splunk.com/Documentation"
 
+# pooled keep-alive client with an on-disk page cache, links restricted to docs.splunk.com
+fetcher = Fetcher(link_host="docs.splunk.com")
+
+# pages are cached for 10 minutes, fetch errors are not cached
 @tool
+@cached_tool(ttl=600, should_cache=lambda result: not result.startswith("Error fetching"))
 def fetch_page_content(url: str) -> str:
     """Fetch the content of a given URL from Splunk documentation."""
     try:
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        content = soup.get_text(strip=True)[:4000]  # Limit content size
-
-        # Collect links pointing to docs.splunk.com
-        all_links = {}
-        for a in soup.find_all('a', href=True):
-            href = a.get('href')
-            text = a.get_text(strip=True)
-            if href.startswith('http') and 'docs.splunk.com' in href:
-                all_links[href] = text
-
-        top_links = list(all_links.items())[:10]
-        link_options = "\n".join([f"{text}: {l}" for (l, text) in top_links])
+        # text is limited to 4000 characters and the first 10 docs.splunk.com links
+        page = fetcher.fetch(url)
+        content = page["content"]
+        link_options = "\n".join([f"{text}: {l}" for (l, text) in page["links"]])
         print(f"Content: {content}\nAvailable links:\n{link_options}")
         return f"Content: {content}\nAvailable links:\n{link_options}"
 
@@ -100,11 +121,21 @@ def fetch_page_content(url: str) -> str:
         return f"Error fetching {url}: {str(e)}"
 
 @tool
+@cached_tool()
 def search_doc_info(query: str) -> str:
     """Retrieve documentations from embeddings."""
     docs = docs_db.similarity_search(query, k=2)
     return "\n".join([f"{doc.metadata['product']}: {doc.page_content}" for doc in docs])
 
+# CRAWL_ON_STARTUP=true refreshes the documentation embeddings in the background
+if os.getenv("CRAWL_ON_STARTUP", "false").lower() == "true":
+    threading.Thread(
+        target=crawl_and_index,
+        args=(docs_db, embeddings_model, fetcher),
+        kwargs={"on_upsert": product_index.add, "on_delete": product_index.remove},
+        daemon=True
+    ).start()
+
 @tool
 def provide_answer(answer: str) -> str:
     """Provide the final answer to the user's question."""
@@ -122,55 +153,38 @@ You are a Splunk documentation navigator. Your goal is to answer questions about
 5. Limit traversal to 5 steps; if no answer is found, provide the best available information with `provide_answer`.
 """
 
-prompt_template = """
-Answer the following questions as best you can. You have access to the following tools:
-    
-{tools}
-
-Use the following format:
-
-Question: the input question you must answer
-Thought: you should always think about what to do
-Action: the action to take, should be one of [{tool_names}]
-Action Input: the input to the action
-Observation: the result of the action
-... (this Thought/Action/Action Input/Observation can repeat N times)
-Thought: I now know the final answer
-Final Answer: the final answer to the original input question
-
-Begin!
-
-Question: {input}
-Thought:{agent_scratchpad}
-"""
-prompt = PromptTemplate.from_template(prompt_template)
+# the instructions go before the ReAct format, which keeps the {tools}, {input} and
+# {agent_scratchpad} slots the agent fills in
+prompt = PromptTemplate.from_template(agent_instructions + REACT_TEMPLATE)
 print(f"Prompt: {prompt}")
 
-prompt.template = agent_instructions  # Fix: Use `template` instead of `messages`
+tools = [fetch_page_content, search_doc_info, provide_answer]
 
 agent = create_react_agent(
     llm=model,
-    tools=[fetch_page_content, search_doc_info, provide_answer],
-    prompt=prompt
+    tools=tools,
+    prompt=prompt,
+    # repairs near-miss output from small models without another model call
+    output_parser=TolerantReActParser(tool_names=[t.name for t in tools])
 )
 
 agent_executor = AgentExecutor(
     agent=agent,
-    tools=[fetch_page_content, search_doc_info, provide_answer],
+    tools=tools,
     verbose=True,
     max_iterations=3,  # Limit traversal steps
-    # handle_parsing_errors=True
+    # output the parser can't repair is sent back to the model instead of ending the run
+    handle_parsing_errors=True
 )
 
 # -----------------------------
 # Managing Chat History
 # -----------------------------
-store = {}
+# bounded, evicting session histories (HISTORY_BACKEND=redis to share them across processes)
+store = create_history_store()
 
 def get_session_history(session_id: str) -> BaseChatMessageHistory:
-    if session_id not in store:
-        store[session_id] = InMemoryChatMessageHistory()
-    return store[session_id]
+    return store.get(session_id)
 
 with_message_history = RunnableWithMessageHistory(
     agent_executor,
@@ -179,29 +193,80 @@ with_message_history = RunnableWithMessageHistory(
     history_messages_key="chat_history"
 )
 
+meter = metrics.get_meter(__name__)
+time_to_first_token = meter.create_histogram(
+    "askquestion.time_to_first_token",
+    unit="s",
+    description="Time from receiving a streamed question to sending its first agent step"
+)
+
+def agent_events(chunk):
+    """Turn an AgentExecutor stream chunk into server-sent events."""
+    for action in chunk.get("actions", []):
+        yield "action", {"tool": action.tool, "tool_input": action.tool_input, "log": action.log}
+    for step in chunk.get("steps", []):
+        yield "observation", {"tool": step.action.tool, "observation": str(step.observation)}
+    if "output" in chunk:
+        yield "answer", chunk["output"]
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def agent_input(question):
+    return {"input": f"Start at {ROOT_URL} and answer: {question}"}
+
+# yields each agent step as it happens, so a client sees the pages being searched and
+# fetched instead of waiting for the whole traversal
+def stream_answer(question, session_id):
+    start = time.perf_counter()
+    config = {"configurable": {"session_id": session_id}}
+    first = True
+    for chunk in with_message_history.stream(agent_input(question), config=config):
+        for event, data in agent_events(chunk):
+            if first:
+                time_to_first_token.record(time.perf_counter() - start)
+                first = False
+            yield sse(event, data)
+
+# -----------------------------
+# Warm-up and Readiness
+# -----------------------------
+startup.mark("agent")
+
+# seeding the store and the first model request happen in the background instead of at import
+startup.warm_up([
+    ("docs_db", prepare_docs_db),
+    ("model", lambda: model.invoke("Reply with OK"))
+])
+
 # -----------------------------
 # Flask Endpoints
 # -----------------------------
+@app.route("/ready", methods=['GET'])
+def ready():
+    if startup.ready.is_set():
+        return "ready"
+    return "warming up", 503
+
 @app.route("/askquestion", methods=['POST'])
 def ask_question():
     data = request.json
     question = data.get('question')
     session_id = data.get('session_id', 'default')
+    # opt in to streaming the agent steps with {"stream": true}
+    if data.get('stream'):
+        return Response(stream_answer(question, session_id), mimetype="text/event-stream")
     config = {"configurable": {"session_id": session_id}}
 
-    response = with_message_history.invoke(
-        {"input": f"Start at {ROOT_URL} and answer: {question}"},
-        config=config
-    )
+    response = with_message_history.invoke(agent_input(question), config=config)
     return jsonify({"answer": response["output"]})
 
 @app.route("/random", methods=['GET'])
 def random_product():
-    all_metadatas = docs_db.get()['metadatas']
-    product_names = [meta["product"] for meta in all_metadatas if "product" in meta]
-    if not product_names:
+    product_name = product_index.sample("product")
+    if not product_name:
         return "No products found", 404
-    return random.choice(product_names)
+    return product_name
 
 if __name__ == '__main__':
     app.run(debug=True, port=8080)
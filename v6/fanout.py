@@ -0,0 +1,45 @@
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# "true" (default) gives the agent one search_all tool over every vector store instead of one tool per store
+FANOUT_RETRIEVAL = os.getenv("FANOUT_RETRIEVAL", "true").lower() == "true"
+FANOUT_K = int(os.getenv("FANOUT_K", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("FANOUT_MAX_WORKERS", "8")))
+
+
+class FanOutRetriever:
+    """Searches several vector stores concurrently with a single query embedding and
+    merges the results by distance to the query, so the agent needs one step instead of
+    one per store.
+
+    The stores share the embedding model and are all Chroma or all NumpyVectorStore
+    (VECTOR_STORE), so their distances are comparable and the k closest documents win,
+    whichever store they come from."""
+
+    def __init__(self, stores, embeddings_model, k=FANOUT_K):
+        self.stores = stores
+        self.embeddings_model = embeddings_model
+        self.k = k
+
+    def search(self, query):
+        """Returns (store name, document) pairs, best first."""
+        vector = self.embeddings_model.embed_query(query)
+        futures = {
+            name: _executor.submit(store.similarity_search_by_vector_with_relevance_scores, vector, self.k)
+            for name, store in self.stores.items()
+        }
+        return self._fuse({name: future.result() for name, future in futures.items()})
+
+    def _fuse(self, results):
+        # (distance, store name, document) of each distinct text, lower distance is better
+        best = {}
+        for name, scored_docs in results.items():
+            for doc, distance in scored_docs:
+                if doc.page_content not in best or distance < best[doc.page_content][0]:
+                    best[doc.page_content] = (distance, name, doc)
+        return [(name, doc) for _, name, doc in heapq.nsmallest(self.k, best.values(), key=lambda item: item[0])]
+
+    def format(self, query):
+        return "\n".join(f"[{name}] {doc.page_content}" for name, doc in self.search(query))
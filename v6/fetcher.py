@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import sys
+import time
+from html.parser import HTMLParser
+from urllib.parse import urldefrag, urljoin, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from opentelemetry import metrics
+
+FETCH_CACHE_DIR = os.getenv("FETCH_CACHE_DIR", "../page_cache")
+FETCH_CACHE_MAX_AGE_SECONDS = float(os.getenv("FETCH_CACHE_MAX_AGE_SECONDS", "300"))
+FETCH_TIMEOUT_SECONDS = float(os.getenv("FETCH_TIMEOUT_SECONDS", "5"))
+FETCH_POOL_SIZE = int(os.getenv("FETCH_POOL_SIZE", "10"))
+
+# what the agent sees of a page: the first CONTENT_CHARS characters of text and MAX_LINKS links
+CONTENT_CHARS = 4000
+MAX_LINKS = 10
+CHUNK_BYTES = 16384
+
+SKIP_TAGS = {"script", "style", "noscript", "template"}
+
+meter = metrics.get_meter(__name__)
+fetch_requests = meter.create_counter(
+    "fetcher.requests",
+    description="Page fetches, by result (fresh, not_modified or fetched)"
+)
+
+
+class PageExtractor(HTMLParser):
+    """Streaming text and link extractor. done turns true once it has max_chars of
+    text and max_links links, so the caller can stop reading the page."""
+
+    def __init__(self, base_url, max_chars=CONTENT_CHARS, max_links=MAX_LINKS, link_host=None):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.max_chars = max_chars
+        self.max_links = max_links
+        self.link_host = link_host
+        self.text = []
+        self.chars = 0
+        self.links = {}
+        self._skip = 0
+        self._href = None
+        self._link_text = []
+        # the parser may hand over one run of text in several pieces, e.g. split by a chunk boundary
+        self._in_text = False
+
+    @property
+    def done(self):
+        enough_text = self.max_chars is not None and self.chars >= self.max_chars
+        return enough_text and len(self.links) >= self.max_links
+
+    def _wanted(self, url):
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https"):
+            return False
+        host = parsed.hostname or ""
+        return self.link_host is None or host == self.link_host or host.endswith("." + self.link_host)
+
+    def handle_starttag(self, tag, attrs):
+        self._in_text = False
+        if tag in SKIP_TAGS:
+            self._skip += 1
+        elif tag == "a":
+            href = dict(attrs).get("href")
+            self._href = urldefrag(urljoin(self.base_url, href))[0] if href else None
+            self._link_text = []
+
+    def handle_endtag(self, tag):
+        self._in_text = False
+        if tag in SKIP_TAGS:
+            self._skip = max(self._skip - 1, 0)
+        elif tag == "a" and self._href:
+            if len(self.links) < self.max_links and self._href not in self.links and self._wanted(self._href):
+                self.links[self._href] = " ".join("".join(self._link_text).split())
+            self._href = None
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        if self._href is not None:
+            self._link_text.append(data)
+        if self.max_chars is None or self.chars < self.max_chars:
+            if self._in_text:
+                self.text[-1] += data
+            else:
+                self.text.append(data)
+                self.chars += 1
+            self.chars += len(data.strip())
+        self._in_text = True
+
+    def content(self):
+        return " ".join(" ".join(self.text).split())[:self.max_chars]
+
+
+class Fetcher:
+    """Fetches pages over a pooled keep-alive session and keeps the extracted text and links
+    on disk. Cached pages are reused for max_age seconds, then revalidated with a conditional
+    GET (If-None-Match / If-Modified-Since) so unchanged pages are not downloaded again.
+
+    link_host restricts the returned links to one site (and its subdomains)."""
+
+    def __init__(
+        self,
+        link_host=None,
+        cache_dir=FETCH_CACHE_DIR,
+        max_age=FETCH_CACHE_MAX_AGE_SECONDS,
+        timeout=FETCH_TIMEOUT_SECONDS,
+        pool_size=FETCH_POOL_SIZE
+    ):
+        self.link_host = link_host
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url, max_chars, max_links):
+        if not self.cache_dir:
+            return None
+        key = f"{url}\x00{max_chars}\x00{max_links}\x00{self.link_host}"
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _load(self, path):
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, path, page):
+        if path is None:
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(page, f)
+        os.replace(tmp_path, path)
+
+    def fetch(self, url, max_chars=CONTENT_CHARS, max_links=MAX_LINKS):
+        """Returns {"url", "content", "links": [[link, text], ...]}. max_chars=None extracts the whole page."""
+        path = self._path(url, max_chars, max_links)
+        cached = self._load(path)
+        if cached and time.time() - cached["fetched"] < self.max_age:
+            fetch_requests.add(1, {"result": "fresh"})
+            return cached
+
+        headers = {}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+            if cached and response.status_code == 304:
+                fetch_requests.add(1, {"result": "not_modified"})
+                cached["fetched"] = time.time()
+                self._save(path, cached)
+                return cached
+            response.raise_for_status()
+            if "charset" not in response.headers.get("Content-Type", ""):
+                response.encoding = "utf-8"
+
+            extractor = PageExtractor(response.url, max_chars, max_links, self.link_host)
+            for chunk in response.iter_content(CHUNK_BYTES, decode_unicode=True):
+                extractor.feed(chunk)
+                if extractor.done:
+                    break
+            extractor.close()
+
+            page = {
+                "url": response.url,
+                "content": extractor.content(),
+                "links": [[link, text] for link, text in extractor.links.items()],
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "fetched": time.time()
+            }
+        fetch_requests.add(1, {"result": "fetched"})
+        self._save(path, page)
+        return page
+
+
+if __name__ == '__main__':
+    # e.g. python fetcher.py https://docs.splunk.com/Documentation docs.splunk.com
+    page = Fetcher(link_host=sys.argv[2] if len(sys.argv) > 2 else None).fetch(sys.argv[1])
+    print(page["content"])
+    for link, text in page["links"]:
+        print(f"{text}: {link}")
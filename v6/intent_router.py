@@ -0,0 +1,175 @@
+import os
+import re
+import threading
+from collections import namedtuple
+
+import numpy as np
+from opentelemetry import metrics
+
+# "true" (default) answers questions that clearly match one intent with a single completion
+# instead of the ReAct agent
+INTENT_ROUTING = os.getenv("INTENT_ROUTING", "true").lower() == "true"
+# cosine similarity to the closest exemplar needed to skip the agent, and its lead over
+# the runner-up intent
+INTENT_ROUTER_THRESHOLD = float(os.getenv("INTENT_ROUTER_THRESHOLD", "0.75"))
+INTENT_ROUTER_MARGIN = float(os.getenv("INTENT_ROUTER_MARGIN", "0.05"))
+
+# the agent's own route, for questions that may need more than one step
+AGENT = "agent"
+
+# example questions for each direct route, compared to the question by embedding. Keep them
+# out of HELD_OUT and client.py, so measuring the router doesn't score its own exemplars
+EXEMPLARS = {
+    "company": [
+        "What can you tell me about Oracle Corporation?",
+        "What does Microsoft do?",
+        "Which industry is Cherry and Sons in?",
+        "Give me information about the company Tesla",
+        "Where is Amazon headquartered?",
+        "What is the website of Google?"
+    ],
+    "general": [
+        "What is the capital city of Japan?",
+        "Who wrote Romeo and Juliet?",
+        "How does photosynthesis work?",
+        "When did World War II end?",
+        "What is the boiling point of water?",
+        "How many planets are in the solar system?"
+    ],
+    "web": [
+        "Are there any new headlines about Netflix?",
+        "What happened in the stock market today?",
+        "What are the recent announcements from Apple?",
+        "What is the current weather in London?"
+    ]
+}
+
+# questions to measure the router on, with the route each should take: python intent_router.py
+HELD_OUT = [
+    ("Tell me about Apple Inc.", "company"),
+    ("What industry is Stewart-Flynn in?", "company"),
+    ("Where is Samsung based?", "company"),
+    ("What is the capital of France?", "general"),
+    ("Who painted the Mona Lisa?", "general"),
+    ("How do vaccines work?", "general"),
+    ("What is the latest news about Tesla?", "web"),
+    ("Compare Apple and Microsoft", AGENT),
+    ("Who founded Tesla and what else did they start?", AGENT),
+    ("Which companies are in the same industry as Cherry and Sons, and where are they?", AGENT)
+]
+
+# questions the agent should plan for: comparisons, sequences and several questions at once
+MULTI_STEP = re.compile(r"\b(compare|comparison|versus|vs\.?|and then|after that|both|difference between)\b|\?.+\?", re.I)
+# questions about what is happening now, which only the web search can answer
+WEB = re.compile(r"\b(latest|news|today|tonight|currently|recent|this (week|month|year))\b", re.I)
+MAX_DIRECT_WORDS = 30
+
+meter = metrics.get_meter(__name__)
+decisions = meter.create_counter(
+    "intent_router.decisions",
+    description="Questions routed to each retriever or to the agent, by reason"
+)
+similarity = meter.create_histogram(
+    "intent_router.similarity",
+    description="Cosine similarity of each embedded question to its closest exemplar"
+)
+
+# route: a key of EXEMPLARS or AGENT; embedding: the question's embedding, when one was made,
+# for the retriever to reuse
+Decision = namedtuple("Decision", ["route", "reason", "score", "embedding"])
+
+
+class IntentRouter:
+    """Decides whether a question can skip the ReAct agent.
+
+    Cheap heuristics come first: questions that look multi-step go to the agent and questions
+    about current events go to the web search. Otherwise the question is embedded and compared
+    to the exemplars of each route. It goes to the closest route only when the match is close
+    and clear, and to the agent when unsure."""
+
+    def __init__(
+        self,
+        embeddings_model,
+        exemplars=EXEMPLARS,
+        threshold=INTENT_ROUTER_THRESHOLD,
+        margin=INTENT_ROUTER_MARGIN
+    ):
+        self.embeddings_model = embeddings_model
+        self.exemplars = exemplars
+        self.threshold = threshold
+        self.margin = margin
+        self._routes = None
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    def prepare(self):
+        """Embeds the exemplars, done once, e.g. during the warm-up."""
+        with self._lock:
+            if self._matrix is not None:
+                return
+            routes = [route for route, questions in self.exemplars.items() for _ in questions]
+            texts = [question for questions in self.exemplars.values() for question in questions]
+            matrix = np.asarray(self.embeddings_model.embed_documents(texts), dtype=np.float32)
+            matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._routes = np.array(routes)
+            self._matrix = matrix
+
+    def _heuristic(self, question):
+        if len(question.split()) > MAX_DIRECT_WORDS or MULTI_STEP.search(question):
+            return Decision(AGENT, "multi_step", None, None)
+        if "web" in self.exemplars and WEB.search(question):
+            return Decision("web", "keyword", None, None)
+        return None
+
+    def _closest(self, embedding):
+        self.prepare()
+        # not in place, the embedding is handed on to the retriever
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = self._matrix @ query
+        # best exemplar score of each route
+        best = {route: float(scores[self._routes == route].max()) for route in self.exemplars}
+        ranked = sorted(best, key=best.get, reverse=True)
+        score = best[ranked[0]]
+        runner_up = best[ranked[1]] if len(ranked) > 1 else -1.0
+        similarity.record(score)
+        if score < self.threshold:
+            return Decision(AGENT, "low_similarity", score, embedding)
+        if score - runner_up < self.margin:
+            return Decision(AGENT, "ambiguous", score, embedding)
+        return Decision(ranked[0], "similarity", score, embedding)
+
+    def _record(self, decision):
+        decisions.add(1, {"route": decision.route, "reason": decision.reason})
+        return decision
+
+    def route(self, question):
+        decision = self._heuristic(question)
+        if decision is None:
+            decision = self._closest(self.embeddings_model.embed_query(question))
+        return self._record(decision)
+
+    async def aroute(self, question):
+        decision = self._heuristic(question)
+        if decision is None:
+            decision = self._closest(await self.embeddings_model.aembed_query(question))
+        return self._record(decision)
+
+
+if __name__ == '__main__':
+    # the share of HELD_OUT answered directly, and the wrong routes, with the app's embeddings
+    from langchain_openai import OpenAIEmbeddings
+
+    router = IntentRouter(OpenAIEmbeddings(
+        check_embedding_ctx_length=False,
+        model="text-embedding-nomic-embed-text-v1.5",
+        base_url="http://localhost:1234/v1",
+        openai_api_key="not-needed"
+    ))
+    routed = [(question, expected, router.route(question)) for question, expected in HELD_OUT]
+    for question, expected, decision in routed:
+        score = f"{decision.score:.3f}" if decision.score is not None else "-"
+        print(f'{decision.route:8} {decision.reason:15} {score:6} expected {expected:8} {question}')
+    direct = sum(decision.route != AGENT for _, _, decision in routed)
+    wrong = sum(decision.route not in (AGENT, expected) for _, expected, decision in routed)
+    print(f'direct: {direct}/{len(routed)}, wrong route: {wrong}')
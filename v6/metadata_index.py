@@ -0,0 +1,87 @@
+import random
+import threading
+
+# page size used when reading the metadata of an existing collection
+PAGE_SIZE = 10000
+
+
+class MetadataIndex:
+    """Distinct values of chosen metadata fields, kept up to date on upsert and delete.
+
+    Each value is counted once per record that has it and dropped when its last record is
+    deleted or changed. Values are stored in a list plus a value -> position map, so adding
+    and removing a value and sampling a random one are all O(1) instead of a scan of the
+    whole collection."""
+
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self._values = {field: [] for field in self.fields}
+        self._positions = {field: {} for field in self.fields}
+        self._counts = {field: {} for field in self.fields}
+        # record id -> {field: value}, to know what a deleted or updated record had
+        self._records = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_store(cls, store, fields):
+        index = cls(fields)
+        index.add_store(store)
+        return index
+
+    def add_store(self, store):
+        """Add the metadata of every record in a Chroma or NumpyVectorStore, a page at a time."""
+        offset = 0
+        while True:
+            page = store.get(include=["metadatas"], limit=PAGE_SIZE, offset=offset)
+            self.add(page["ids"], page["metadatas"])
+            if len(page["ids"]) < PAGE_SIZE:
+                return
+            offset += PAGE_SIZE
+
+    def add(self, ids, metadatas):
+        """Add upserted records. A record that is already indexed is replaced."""
+        with self._lock:
+            for record_id, meta in zip(ids, metadatas):
+                self._drop(record_id)
+                values = {field: (meta or {}).get(field) for field in self.fields}
+                values = {field: value for field, value in values.items() if value}
+                if values:
+                    self._records[record_id] = values
+                    for field, value in values.items():
+                        self._count(field, value, 1)
+
+    def remove(self, ids):
+        """Remove deleted records."""
+        with self._lock:
+            for record_id in ids:
+                self._drop(record_id)
+
+    def _drop(self, record_id):
+        for field, value in self._records.pop(record_id, {}).items():
+            self._count(field, value, -1)
+
+    def _count(self, field, value, delta):
+        counts = self._counts[field]
+        counts[value] = counts.get(value, 0) + delta
+        values = self._values[field]
+        positions = self._positions[field]
+        if delta > 0 and counts[value] == delta:
+            positions[value] = len(values)
+            values.append(value)
+        elif counts[value] == 0:
+            del counts[value]
+            # the last value takes the place of the removed one
+            position = positions.pop(value)
+            last = values.pop()
+            if last != value:
+                values[position] = last
+                positions[last] = position
+
+    def sample(self, field):
+        with self._lock:
+            values = self._values[field]
+            return random.choice(values) if values else None
+
+    def values(self, field):
+        with self._lock:
+            return list(self._values[field])
@@ -0,0 +1,118 @@
+import json
+import os
+import sys
+
+import numpy as np
+from langchain_core.documents import Document
+
+# "chroma" (default) or "numpy" to answer similarity searches from an in-memory index
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma")
+
+
+def _check_supported(kwargs):
+    """Raises on Chroma arguments this store doesn't implement, e.g. a metadata filter,
+    instead of quietly ignoring them."""
+    unsupported = sorted(name for name, value in kwargs.items() if value is not None)
+    if unsupported:
+        raise ValueError(f"NumpyVectorStore doesn't support these arguments: {', '.join(unsupported)}")
+
+
+class NumpyVectorStore:
+    """In-memory vector store over one contiguous float32 matrix of normalized vectors.
+
+    Implements the part of the Chroma interface the apps use, without metadata filters. Top-k
+    is one matrix-vector product plus argpartition; the matrix can be memory-mapped from disk."""
+
+    def __init__(self, embedding_function, vectors, ids, documents, metadatas):
+        self.embedding_function = embedding_function
+        self.vectors = vectors
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+
+    @classmethod
+    def from_chroma(cls, db, embedding_function=None):
+        data = db.get(include=["embeddings", "documents", "metadatas"])
+        vectors = np.asarray(data["embeddings"], dtype=np.float32).reshape(len(data["ids"]), -1)
+        # with normalized rows, the dot product ranks the same way as cosine similarity
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+        return cls(
+            embedding_function,
+            np.ascontiguousarray(vectors),
+            list(data["ids"]),
+            list(data["documents"]),
+            [meta or {} for meta in data["metadatas"]]
+        )
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "vectors.npy"), self.vectors)
+        with open(os.path.join(path, "records.json"), "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "documents": self.documents, "metadatas": self.metadatas}, f)
+
+    @classmethod
+    def load(cls, path, embedding_function, mmap=True):
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r" if mmap else None)
+        with open(os.path.join(path, "records.json"), encoding="utf-8") as f:
+            records = json.load(f)
+        return cls(embedding_function, vectors, records["ids"], records["documents"], records["metadatas"])
+
+    def _document(self, i):
+        return Document(id=self.ids[i], page_content=self.documents[i], metadata=self.metadatas[i])
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, **kwargs):
+        _check_supported(kwargs)
+        if not self.ids:
+            return []
+        # not in place, embedding may be the caller's own float32 array
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = self.vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._document(i), float(scores[i])) for i in top]
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4, **kwargs):
+        # Chroma's convention: a distance, lower is more similar
+        return [
+            (doc, 1.0 - score) for doc, score in self.similarity_search_by_vector_with_score(embedding, k, **kwargs)
+        ]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, **kwargs)]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        _check_supported(kwargs)
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k)
+
+    async def asimilarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return self.similarity_search_by_vector(embedding, k, **kwargs)
+
+    async def asimilarity_search(self, query, k=4, **kwargs):
+        _check_supported(kwargs)
+        return self.similarity_search_by_vector(await self.embedding_function.aembed_query(query), k)
+
+    def get(self, ids=None, include=None, limit=None, offset=None, **kwargs):
+        # e.g. where= or where_document=
+        _check_supported(kwargs)
+        indexes = range(len(self.ids))
+        if ids is not None:
+            wanted = set(ids)
+            indexes = [i for i in indexes if self.ids[i] in wanted]
+        start = offset or 0
+        indexes = indexes[start:start + limit if limit is not None else None]
+        return {
+            "ids": [self.ids[i] for i in indexes],
+            "documents": [self.documents[i] for i in indexes],
+            "metadatas": [self.metadatas[i] for i in indexes],
+            "embeddings": None
+        }
+
+
+if __name__ == '__main__':
+    # export an existing Chroma store, e.g. python numpy_store.py ../my_embeddings ../my_embeddings_numpy
+    from langchain_chroma import Chroma
+
+    NumpyVectorStore.from_chroma(Chroma(persist_directory=sys.argv[1])).save(sys.argv[2])
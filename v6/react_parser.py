@@ -0,0 +1,174 @@
+import json
+import re
+
+from langchain.agents.output_parsers import ReActSingleInputOutputParser
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.exceptions import OutputParserException
+from opentelemetry import metrics
+
+meter = metrics.get_meter(__name__)
+parse_results = meter.create_counter(
+    "react_parser.results",
+    description="ReAct model outputs by result (ok, repaired or failed) and the repair that was applied"
+)
+
+# sent back to the model, as the observation, when its output can't be repaired
+FORMAT_REMINDER = (
+    "Invalid format. Reply with either\n"
+    "Action: one of [{tool_names}]\n"
+    "Action Input: the input to the action\n"
+    "or\n"
+    "Final Answer: the final answer to the original input question"
+)
+
+# a keyword in any case, with the markdown small models put around it, e.g. **action input:** `
+KEYWORD = re.compile(
+    r"^[ \t#>*_`-]*(thought|action[ \t_]*input|input|action|final[ \t_]*answer|observation)[ \t*_`]*:[ \t*_`]*",
+    re.I | re.M
+)
+KEYWORDS = {
+    "thought": "Thought",
+    "actioninput": "Action Input",
+    "input": "Action Input",
+    "action": "Action",
+    "finalanswer": "Final Answer",
+    "observation": "Observation"
+}
+# a tool called like a function, e.g. search_doc_info("splunk forwarder")
+CALL = re.compile(r"^\s*([\w.-]+)\s*\((.*)\)\s*$", re.S)
+JSON_OBJECT = re.compile(r"\{.*\}", re.S)
+# output without keywords that is the model planning its next step, not an answer
+REASONING = re.compile(r"^\s*(i (should|need|will|must|want|am going to|'ll)|let me|let's|first|next|now)\b", re.I)
+# a complete answer ends like a sentence, output cut off mid-thought doesn't
+ANSWER_END = re.compile(r"[.!?)\]\"'`]\s*$")
+# the markdown closing a Final Answer keyword, e.g. the ** of **Final Answer:**
+ANSWER_MARKUP = re.compile(r"[*_]*[ \t]*")
+
+
+def _keyword(match):
+    return KEYWORDS[re.sub(r"[\s_]", "", match.group(1).lower())] + ": "
+
+
+def _normalize(text):
+    """text with its keywords normalized up to the first Final Answer, the answer itself is
+    left as the model wrote it."""
+    for match in KEYWORD.finditer(text):
+        if _keyword(match) == "Final Answer: ":
+            colon = text.index(":", match.start()) + 1
+            answer = text[ANSWER_MARKUP.match(text, colon).end():]
+            return KEYWORD.sub(_keyword, text[:match.start()]) + "Final Answer: " + answer
+    return KEYWORD.sub(_keyword, text)
+
+
+def _unquote(text):
+    return text.strip().strip("`'\"").strip()
+
+
+class TolerantReActParser(ReActSingleInputOutputParser):
+    """ReAct output parser that repairs near-miss output instead of spending another model
+    call on it: markdown around the keywords, keywords in another case, an observation or
+    final answer made up after the action, tools called like functions or named loosely,
+    quoted action inputs, JSON actions, and plain answers without any keywords. Only output it
+    can't repair goes back to the model, with a reminder of the format."""
+
+    tool_names: list = []
+
+    def parse(self, text):
+        # the strict parser only knows the exact keywords
+        normalized = _normalize(text)
+        repair = "keywords" if normalized.split() != text.split() else None
+        try:
+            result = super().parse(normalized)
+        except OutputParserException as e:
+            result, repair = self._repair(normalized)
+            if result is None:
+                parse_results.add(1, {"result": "failed"})
+                raise OutputParserException(
+                    str(e),
+                    observation=FORMAT_REMINDER.format(tool_names=", ".join(self.tool_names)),
+                    llm_output=text,
+                    send_to_llm=True
+                )
+        if isinstance(result, AgentAction):
+            tool = self._tool_name(result.tool)
+            # e.g. the backticks left by **Action Input:** `splunk`
+            tool_input = _unquote(result.tool_input)
+            if tool != result.tool:
+                repair = repair or "tool_name"
+            elif tool_input != result.tool_input:
+                repair = repair or "quotes"
+            if repair:
+                result = AgentAction(tool, tool_input, result.log)
+        if repair:
+            parse_results.add(1, {"result": "repaired", "repair": repair})
+        else:
+            parse_results.add(1, {"result": "ok"})
+        return result
+
+    def _tool_name(self, name):
+        """The known tool meant by name, e.g. `Search_Doc_Info` or [search_doc_info]."""
+        if not self.tool_names or name in self.tool_names:
+            return name
+        cleaned = name.strip(" \t[]()'\"`.").lower()
+        for tool in self.tool_names:
+            if tool.lower() == cleaned:
+                return tool
+        mentioned = [tool for tool in self.tool_names if tool.lower() in cleaned]
+        return mentioned[0] if len(mentioned) == 1 else name
+
+    def _repair(self, text):
+        """(AgentAction or AgentFinish, repair) from output the strict parser rejected,
+        or (None, None)."""
+        action_at = text.find("Action:")
+        answer_at = text.find("Final Answer:")
+        # an action comes first: the rest was made up by the model, keep the first step only
+        if action_at != -1 and (answer_at == -1 or action_at < answer_at):
+            step = re.split(r"\n(?:Observation|Final Answer|Thought):", text[action_at + len("Action:"):])[0]
+            action, _, action_input = step.partition("Action Input:")
+            action, _, rest = action.strip().partition("\n")
+            action_input = action_input.strip() or rest.strip()
+            call = CALL.match(action)
+            if call and not action_input:
+                action, action_input = call.group(1), call.group(2)
+            if action:
+                return AgentAction(action.strip(), action_input, text), "action"
+
+        if answer_at != -1:
+            return AgentFinish({"output": text[answer_at + len("Final Answer:"):].strip()}, text), "final_answer"
+
+        # {"action": "search_doc_info", "action_input": "..."}
+        match = JSON_OBJECT.search(text)
+        if match:
+            try:
+                data = json.loads(match.group(0))
+            except ValueError:
+                data = None
+            if isinstance(data, dict):
+                action = data.get("action") or data.get("tool") or data.get("name")
+                action_input = data.get("action_input", data.get("input", data.get("query", "")))
+                if isinstance(action, str) and action.lower().replace(" ", "_") == "final_answer":
+                    return AgentFinish({"output": str(action_input)}, text), "json"
+                if isinstance(action, str) and action:
+                    if not isinstance(action_input, str):
+                        action_input = json.dumps(action_input)
+                    return AgentAction(action, action_input, text), "json"
+
+        # a line that calls one of the tools like a function
+        for line in text.splitlines():
+            call = CALL.match(line)
+            if call and self._tool_name(call.group(1)) in self.tool_names:
+                return AgentAction(call.group(1), call.group(2), text), "call"
+
+        # no keywords at all, the model just answered
+        if self._is_plain_answer(text):
+            return AgentFinish({"output": text.strip()}, text), "plain_answer"
+        return None, None
+
+    def _is_plain_answer(self, text):
+        """True for output without keywords that reads like a complete answer, rather than
+        reasoning that was cut off or doesn't say what to do next."""
+        if not text.strip() or KEYWORD.search(text) or REASONING.match(text):
+            return False
+        if any(tool.lower() in text.lower() for tool in self.tool_names):
+            return False
+        return bool(ANSWER_END.search(text))
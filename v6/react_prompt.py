@@ -0,0 +1,35 @@
+import os
+
+from langchain_core.prompts import PromptTemplate
+
+# "local" (default) uses the copy below, "hub" pulls hwchase17/react from the LangChain hub at startup
+REACT_PROMPT_SOURCE = os.getenv("REACT_PROMPT_SOURCE", "local")
+
+# copy of the hwchase17/react prompt, so starting the agent needs no network access
+REACT_TEMPLATE = """Answer the following questions as best you can. You have access to the following tools:
+
+{tools}
+
+Use the following format:
+
+Question: the input question you must answer
+Thought: you should always think about what to do
+Action: the action to take, should be one of [{tool_names}]
+Action Input: the input to the action
+Observation: the result of the action
+... (this Thought/Action/Action Input/Observation can repeat N times)
+Thought: I now know the final answer
+Final Answer: the final answer to the original input question
+
+Begin!
+
+Question: {input}
+Thought:{agent_scratchpad}"""
+
+
+def react_prompt():
+    if REACT_PROMPT_SOURCE == "hub":
+        from langchain import hub
+
+        return hub.pull("hwchase17/react")
+    return PromptTemplate.from_template(REACT_TEMPLATE)
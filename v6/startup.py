@@ -0,0 +1,76 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from opentelemetry import metrics
+
+logger = logging.getLogger(__name__)
+
+meter = metrics.get_meter(__name__)
+phase_duration = meter.create_histogram(
+    "startup.phase_duration",
+    unit="s",
+    description="Time spent in each startup phase"
+)
+
+
+class Startup:
+    """Per-phase startup timings and the readiness of the app.
+
+    mark(phase) records the time since the previous mark, so module-level setup can be
+    timed without re-indenting it; warm_up runs the warm-up steps and then sets ready."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+        self.ready = threading.Event()
+        self._last = self.started
+        self._lock = threading.Lock()
+
+    def _record(self, phase, seconds):
+        with self._lock:
+            self.phases.append((phase, seconds))
+        phase_duration.record(seconds, {"phase": phase})
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self._record(phase, now - self._last)
+        self._last = now
+
+    @contextmanager
+    def phase(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(phase, time.perf_counter() - start)
+
+    def report(self):
+        with self._lock:
+            lines = [f"  {phase:<28}{seconds * 1000:10.1f} ms" for phase, seconds in self.phases]
+        lines.append(f"  {'total':<28}{(time.perf_counter() - self.started) * 1000:10.1f} ms")
+        return "startup phases:\n" + "\n".join(lines)
+
+    def warm_up(self, steps, background=True):
+        """Run the (name, callable) warm-up steps, e.g. a first model and embeddings request
+        and a first vector search, then mark the app ready. A failing step is logged and
+        skipped, so an unavailable backend does not keep the app unready forever."""
+        def run():
+            for name, step in steps:
+                try:
+                    with self.phase(f"warmup.{name}"):
+                        step()
+                except Exception as e:
+                    logger.warning("warm-up step %s failed: %s", name, e)
+            self.ready.set()
+            print(self.report())
+
+        if background:
+            threading.Thread(target=run, name="warm-up", daemon=True).start()
+        else:
+            run()
+
+
+# created on import, so importing this module first also times the other imports
+startup = Startup()
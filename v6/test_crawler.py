@@ -0,0 +1,105 @@
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain_chroma import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from crawler import CrawlStatus, crawl, crawl_and_index
+from fetcher import Fetcher
+
+PAGES = {
+    # /docs/a and /docs/a/ both end up at /docs/a/
+    "docs/index.html": '<a href="/docs/a">A</a> <a href="/docs/a/">A again</a> '
+                       '<a href="/docs/b.html">B</a> <a href="/docs/c.html">C</a>',
+    "docs/a/index.html": "Page A is about forwarders.",
+    "docs/b.html": "Page B is about indexers.",
+    "docs/c.html": "Page C is about searches."
+}
+
+
+class Handler(SimpleHTTPRequestHandler):
+    # paths that answer 500, like a server having a bad moment
+    failing = set()
+
+    def do_GET(self):
+        if self.path in self.failing:
+            self.send_error(500)
+        else:
+            super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site(tmp_path):
+    """A local static copy of a documentation site, served over HTTP. Yields (root, root_url)."""
+    root = tmp_path / "site"
+    for path, body in PAGES.items():
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_text(f"<html><body>{body}</body></html>")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(Handler, directory=str(root)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield root, f"http://127.0.0.1:{server.server_port}/docs/"
+    server.shutdown()
+    server.server_close()
+    Handler.failing.clear()
+
+
+@pytest.fixture
+def index(tmp_path):
+    """crawl_and_index against a fresh store, returning the URLs in the store."""
+    embeddings = DeterministicFakeEmbedding(size=8)
+    db = Chroma(persist_directory=str(tmp_path / "db"), embedding_function=embeddings)
+    fetcher = Fetcher(link_host="127.0.0.1", cache_dir=None)
+
+    def run(root_url, **kwargs):
+        crawl_and_index(db, embeddings, fetcher, root_url, manifest_path=str(tmp_path / "manifest.json"), **kwargs)
+        return {meta["url"] for meta in db.get(include=["metadatas"])["metadatas"]}
+
+    return run
+
+
+def test_redirects_are_crawled_once(site):
+    _, root_url = site
+    status = CrawlStatus()
+    urls = [page["url"] for page in crawl(Fetcher(link_host="127.0.0.1", cache_dir=None), root_url, status=status)]
+    assert sorted(urls) == sorted(root_url + path for path in ["", "a/", "b.html", "c.html"])
+    assert status.complete
+
+
+def test_crawl_and_index(site, index):
+    _, root_url = site
+    assert index(root_url) == {root_url + path for path in ["", "a/", "b.html", "c.html"]}
+
+
+def test_failed_fetch_keeps_chunks(site, index):
+    _, root_url = site
+    index(root_url)
+    Handler.failing.add("/docs/b.html")
+    assert root_url + "b.html" in index(root_url)
+
+
+def test_truncated_crawl_keeps_chunks(site, index):
+    _, root_url = site
+    before = index(root_url)
+    assert index(root_url, max_pages=2) == before
+
+
+def test_removed_pages_are_deleted(site, index):
+    root, root_url = site
+    index(root_url)
+    # c.html answers 404, a/ is no longer linked
+    (root / "docs/c.html").unlink()
+    (root / "docs/index.html").write_text('<html><body><a href="/docs/b.html">B</a></body></html>')
+    assert index(root_url) == {root_url, root_url + "b.html"}
+
+
+def test_missing_page_is_deleted_from_partial_crawl(site, index):
+    root, root_url = site
+    index(root_url)
+    (root / "docs/c.html").unlink()
+    Handler.failing.add("/docs/b.html")
+    assert index(root_url) == {root_url + path for path in ["", "a/", "b.html"]}
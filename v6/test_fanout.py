@@ -0,0 +1,50 @@
+import pytest
+from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+
+from fanout import FanOutRetriever
+from numpy_store import NumpyVectorStore
+
+VECTORS = {
+    "question": [1.0, 0.0],
+    "company 1": [1.0, 0.1],
+    "company 2": [1.0, 0.2],
+    "company 3": [1.0, 0.3],
+    "general 1": [0.2, 1.0],
+    "general 2": [0.1, 1.0]
+}
+
+
+class FixedEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [VECTORS[text] for text in texts]
+
+    def embed_query(self, text):
+        return VECTORS[text]
+
+
+@pytest.fixture(params=["chroma", "numpy"])
+def fanout(request, tmp_path):
+    embeddings = FixedEmbeddings()
+    stores = {}
+    for name in ["company", "general"]:
+        texts = [text for text in VECTORS if text.startswith(name)]
+        db = Chroma.from_texts(texts, embeddings, persist_directory=str(tmp_path / name), collection_name=name)
+        stores[name] = NumpyVectorStore.from_chroma(db, embeddings) if request.param == "numpy" else db
+    return FanOutRetriever(stores, embeddings, k=3)
+
+
+def test_closest_documents_win_whichever_store_they_are_in(fanout):
+    # rank fusion would take the best of each store; the general documents are all further away
+    results = fanout.search("question")
+    assert [(name, doc.page_content) for name, doc in results] == [
+        ("company", "company 1"), ("company", "company 2"), ("company", "company 3")
+    ]
+
+
+def test_duplicates_are_merged(fanout):
+    results = fanout._fuse({
+        "company": fanout.stores["company"].similarity_search_by_vector_with_relevance_scores([1.0, 0.0], 1),
+        "general": fanout.stores["company"].similarity_search_by_vector_with_relevance_scores([1.0, 0.0], 2)
+    })
+    assert [doc.page_content for _, doc in results] == ["company 1", "company 2"]
@@ -0,0 +1,113 @@
+import io
+
+import pytest
+import requests
+
+from crawler import _fetch
+from fetcher import Fetcher
+
+ROOT = "https://docs.example.com/Documentation/"
+
+
+class CountingBytesIO(io.BytesIO):
+    """Response body that counts the bytes read from it."""
+
+    bytes_read = 0
+
+    def read(self, *args, **kwargs):
+        data = super().read(*args, **kwargs)
+        self.bytes_read += len(data)
+        return data
+
+
+class StubSession:
+    """Stands in for requests.Session: answers each URL from routes, {url: (status, body, final url)}.
+    The final url is where a redirect ended up, as requests reports it. Records the request headers."""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.requests = []
+        self.bodies = []
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        self.requests.append((url, dict(headers or {})))
+        if url not in self.routes:
+            raise requests.ConnectionError(f"cannot connect to {url}")
+        status, body, final_url = self.routes[url]
+        response = requests.Response()
+        response.status_code = status
+        response.url = final_url or url
+        response.headers["Content-Type"] = "text/html"
+        response.headers["ETag"] = '"v1"'
+        response.raw = CountingBytesIO(body.encode("utf-8"))
+        self.bodies.append(response.raw)
+        return response
+
+
+def fetcher_with(routes, **kwargs):
+    fetcher = Fetcher(link_host="docs.example.com", cache_dir=kwargs.pop("cache_dir", None), **kwargs)
+    fetcher.session = StubSession(routes)
+    return fetcher
+
+
+def page(body):
+    return f"<html><body>{body}</body></html>"
+
+
+def test_redirect_resolves_links_against_the_final_url():
+    fetcher = fetcher_with({
+        ROOT + "Splunk": (200, page('Splunk docs <a href="Install">Install</a>'), ROOT + "Splunk/latest/")
+    })
+    result = fetcher.fetch(ROOT + "Splunk")
+    assert result["url"] == ROOT + "Splunk/latest/"
+    assert result["links"] == [[ROOT + "Splunk/latest/Install", "Install"]]
+
+
+def test_content_and_links_are_truncated():
+    links = "".join(f'<a href="/page{i}">Page {i}</a>' for i in range(20))
+    fetcher = fetcher_with({ROOT: (200, page(links + "word " * 20000), None)})
+    result = fetcher.fetch(ROOT, max_chars=50, max_links=3)
+    assert len(result["content"]) == 50
+    assert [link for link, _ in result["links"]] == [f"https://docs.example.com/page{i}" for i in range(3)]
+    # it stops reading once it has enough
+    assert fetcher.session.bodies[0].bytes_read < len(page(links + "word " * 20000))
+
+
+def test_whole_page_without_max_chars():
+    fetcher = fetcher_with({ROOT: (200, page("word " * 20000), None)})
+    assert len(fetcher.fetch(ROOT, max_chars=None)["content"]) == len("word " * 20000) - 1
+
+
+def test_links_are_limited_to_the_link_host():
+    links = [
+        "/Splunk", "https://sub.docs.example.com/a", "https://docs.example.com.evil.com/b",
+        "https://example.com/c", "mailto:docs@docs.example.com", "javascript:void(0)", "#top"
+    ]
+    body = "".join(f'<a href="{link}">{link}</a>' for link in links)
+    result = fetcher_with({ROOT: (200, page(body), None)}).fetch(ROOT)
+    assert [link for link, _ in result["links"]] == [
+        "https://docs.example.com/Splunk", "https://sub.docs.example.com/a", ROOT
+    ]
+
+
+def test_scripts_and_styles_are_skipped():
+    body = "<script>var x = 1;</script><style>p {}</style>Visible text"
+    assert fetcher_with({ROOT: (200, page(body), None)}).fetch(ROOT)["content"] == "Visible text"
+
+
+def test_unchanged_page_is_revalidated(tmp_path):
+    fetcher = fetcher_with({ROOT: (200, page("First version"), None)}, cache_dir=str(tmp_path), max_age=0)
+    fetcher.fetch(ROOT)
+    fetcher.session.routes[ROOT] = (304, "", None)
+    assert fetcher.fetch(ROOT)["content"] == "First version"
+    assert fetcher.session.requests[-1][1]["If-None-Match"] == '"v1"'
+
+
+@pytest.mark.parametrize("status, error", [(404, "gone"), (410, "gone"), (500, "failed"), (403, "failed")])
+def test_http_errors_are_classified_for_the_crawler(status, error):
+    fetcher = fetcher_with({ROOT: (status, page("Error"), None)})
+    assert _fetch(fetcher, ROOT) == (ROOT, None, error)
+
+
+def test_connection_errors_are_failures():
+    assert _fetch(fetcher_with({}), ROOT) == (ROOT, None, "failed")
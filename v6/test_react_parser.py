@@ -0,0 +1,63 @@
+import pytest
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.exceptions import OutputParserException
+
+from react_parser import TolerantReActParser
+
+parser = TolerantReActParser(tool_names=["search_doc_info", "fetch_page_content"])
+
+
+def test_strict_output():
+    result = parser.parse("Thought: look it up\nAction: search_doc_info\nAction Input: splunk forwarder")
+    assert isinstance(result, AgentAction)
+    assert (result.tool, result.tool_input) == ("search_doc_info", "splunk forwarder")
+
+
+def test_markdown_action_input_is_unquoted():
+    result = parser.parse("**Action:** search_doc_info\n**Action Input:** `splunk`")
+    assert isinstance(result, AgentAction)
+    assert (result.tool, result.tool_input) == ("search_doc_info", "splunk")
+
+
+def test_quoted_action_input_is_unquoted():
+    result = parser.parse("Action: search_doc_info\nAction Input: `splunk forwarder`")
+    assert result.tool_input == "splunk forwarder"
+
+
+def test_final_answer_is_left_as_written():
+    answer = "The forwarder needs two settings.\nInput: the data to send\n**Action:** none, it's automatic"
+    result = parser.parse("Thought: I know it\n**final answer:** " + answer)
+    assert isinstance(result, AgentFinish)
+    assert result.return_values["output"] == answer
+
+
+def test_function_call_action():
+    result = parser.parse('Thought: search\nsearch_doc_info("splunk forwarder")')
+    assert (result.tool, result.tool_input) == ("search_doc_info", "splunk forwarder")
+
+
+def test_made_up_observation_is_dropped():
+    result = parser.parse(
+        "Action: search_doc_info\nAction Input: splunk\nObservation: made up\nFinal Answer: made up"
+    )
+    assert (result.tool, result.tool_input) == ("search_doc_info", "splunk")
+
+
+def test_plain_answer():
+    result = parser.parse("Splunk forwarders send data to the indexers.")
+    assert isinstance(result, AgentFinish)
+    assert result.return_values["output"] == "Splunk forwarders send data to the indexers."
+
+
+@pytest.mark.parametrize("text", [
+    "I should search for the forwarder docs.",
+    "Let me look at the documentation",
+    "The forwarder is configured in",
+    "I will call search_doc_info with the question.",
+    "   "
+])
+def test_reasoning_is_sent_back_to_the_model(text):
+    with pytest.raises(OutputParserException) as raised:
+        parser.parse(text)
+    assert raised.value.send_to_llm
+    assert "search_doc_info" in raised.value.observation
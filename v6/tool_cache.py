@@ -0,0 +1,107 @@
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from opentelemetry import metrics
+
+TOOL_CACHE_TTL_SECONDS = float(os.getenv("TOOL_CACHE_TTL_SECONDS", "300"))
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1024"))
+
+meter = metrics.get_meter(__name__)
+cache_requests = meter.create_counter(
+    "tool_cache.requests",
+    description="Tool result cache lookups, by tool and result (hit, coalesced or miss)"
+)
+
+
+def _normalize(value):
+    # the agent writes tool inputs itself, so "Apple Inc. " and "Apple Inc." should share an entry
+    return " ".join(value.split()) if isinstance(value, str) else value
+
+
+class ToolCache:
+    """Size-bounded LRU of tool results with a TTL per entry.
+
+    Concurrent calls with the same arguments are coalesced: the first one runs the
+    tool, the others wait for its result instead of repeating the I/O."""
+
+    def __init__(self, name, ttl=TOOL_CACHE_TTL_SECONDS, max_entries=TOOL_CACHE_MAX_ENTRIES, should_cache=None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.should_cache = should_cache
+        self.stats = {"hit": 0, "coalesced": 0, "miss": 0}
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _record(self, result):
+        self.stats[result] += 1
+        cache_requests.add(1, {"result": result, "tool": self.name})
+
+    def get_or_call(self, key, call):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self._record("hit")
+                return entry[1]
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+            self._record("miss" if leader else "coalesced")
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = call()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+        if self.should_cache is None or self.should_cache(value):
+            with self._lock:
+                self._entries[key] = (time.time() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        future.set_result(value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def cached_tool(ttl=TOOL_CACHE_TTL_SECONDS, max_entries=TOOL_CACHE_MAX_ENTRIES, should_cache=None):
+    """Cache a tool function's results, e.g.
+
+        @tool
+        @cached_tool(ttl=600)
+        def fetch_page_content(url: str) -> str: ...
+
+    should_cache(result) can reject results that must not be reused, like error messages."""
+    def decorator(func):
+        cache = ToolCache(func.__name__, ttl, max_entries, should_cache)
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # LangChain passes a plain string input positionally and a dict input as keywords
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = tuple((name, _normalize(value)) for name, value in bound.arguments.items())
+            return cache.get_or_call(key, lambda: func(*args, **kwargs))
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator